@@ -1,10 +1,21 @@
 from werkzeug import find_modules, import_string
 
-from messages import routes
+from messages import commands, routes
+from messages.events import LocalBroker
+from messages.local_cache import LocalCache
 
 
 def init_app(app):
+    app.extensions['messages_broker'] = (
+        app.config.get('MESSAGES_BROKER') or LocalBroker()
+    )
+    if app.config.get('MESSAGES_LOCAL_CACHE_SIZE'):
+        app.extensions['messages_local_cache'] = LocalCache(
+            maxsize=app.config['MESSAGES_LOCAL_CACHE_SIZE'],
+            ttl=app.config.get('MESSAGES_LOCAL_CACHE_TTL', 5),
+        )
     with app.app_context():
         for name in find_modules('messages', recursive=True):
             import_string(name)
         app.register_blueprint(routes.bp)
+    app.cli.add_command(commands.messages_cli)
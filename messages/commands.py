@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+import click
+import flask
+from flask.cli import AppGroup
+
+from core import db
+from messages import versions
+from messages.models import (
+    PrivateConversation,
+    PrivateMailboxCounts,
+    PrivateMessageArchive,
+)
+
+messages_cli = AppGroup('messages', help='Manage private messages.')
+
+
+@messages_cli.command('reconcile-counts')
+def reconcile_counts():
+    """Recompute the mailbox counts of users and message counts of conversations."""
+    recounted_ids = PrivateMailboxCounts.recount()
+    recounted_conv_ids = PrivateConversation.recount_messages()
+    db.session.commit()
+    PrivateMailboxCounts.clear_cache_keys(recounted_ids)
+    versions.bump_users(recounted_ids)
+    PrivateConversation.clear_conversation_cache_keys(recounted_conv_ids)
+    click.echo('Reconciled mailbox and message counts.')
+
+
+@messages_cli.command('refresh-previews')
+def refresh_previews():
+    """Recompute the last message preview of every conversation."""
+    conv_ids = PrivateConversation.refresh_last_messages()
+    db.session.commit()
+    PrivateConversation.clear_conversation_cache_keys(conv_ids)
+    click.echo('Refreshed conversation previews.')
+
+
+@messages_cli.command('archive')
+@click.option(
+    '--days',
+    type=int,
+    default=None,
+    help='Archive messages older than this many days. Defaults to the '
+    'MESSAGES_ARCHIVE_AFTER_DAYS setting.',
+)
+@click.option('--chunk-size', type=int, default=10000)
+def archive(days, chunk_size):
+    """Move old messages to the archive table."""
+    if days is None:
+        days = flask.current_app.config.get('MESSAGES_ARCHIVE_AFTER_DAYS', 365)
+    moved = PrivateMessageArchive.archive(
+        timedelta(days=days), chunk_size=chunk_size
+    )
+    click.echo(f'Archived {moved} messages.')
+
+
+@messages_cli.command('generate')
+@click.option('--users', type=int, default=1000)
+@click.option('--conversations', type=int, default=100000)
+@click.option('--messages', type=int, default=1000000)
+@click.option('--zipf-exponent', type=float, default=1.1)
+@click.option('--group-ratio', type=float, default=0.1)
+@click.option('--max-group-size', type=int, default=10)
+@click.option('--deleted-ratio', type=float, default=0.05)
+@click.option('--sticky-ratio', type=float, default=0.01)
+@click.option('--seed', type=int, default=0)
+def generate(**params):
+    """Load a large synthetic dataset of conversations between existing users."""
+    from messages.test_data import SyntheticMessagesPopulator
+
+    SyntheticMessagesPopulator.populate(**params)
+    click.echo('Generated synthetic messages.')
@@ -0,0 +1,41 @@
+import base64
+import binascii
+import zlib
+from typing import Optional
+
+# Stored contents starting with this character are compressed. It is a control
+# character which message text does not start with in practice; text that does
+# is always stored compressed, so that it is never mistaken for stored data.
+# Rows written before compression existed are read back as they are if they do
+# not decode.
+MARKER = '\x01'
+
+
+def compress(text: str, threshold: Optional[int] = None) -> str:
+    """
+    Get the stored form of message contents. Contents of at least ``threshold``
+    bytes are zlib-compressed and base64-encoded behind the marker, if that makes
+    them smaller. A threshold of ``None`` or 0 disables compression.
+    """
+    raw = text.encode()
+    if not text.startswith(MARKER) and (not threshold or len(raw) < threshold):
+        return text
+    stored = MARKER + base64.b64encode(zlib.compress(raw)).decode()
+    if len(stored) >= len(raw) and not text.startswith(MARKER):
+        return text
+    return stored
+
+
+def decompress(stored: str) -> str:
+    """
+    Get message contents from their stored form, compressed or not. Contents
+    which start with the marker but do not decode are returned unchanged.
+    """
+    if not stored.startswith(MARKER):
+        return stored
+    try:
+        return zlib.decompress(
+            base64.b64decode(stored[1:], validate=True)
+        ).decode()
+    except (binascii.Error, zlib.error, UnicodeDecodeError):
+        return stored
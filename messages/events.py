@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List
+
+import flask
+
+Event = Dict[str, Any]
+
+
+class Broker:
+    """
+    Delivers events to the users they concern. A user only receives the events
+    published after their first wait, and events are kept between waits so that
+    nothing is missed while a client reconnects.
+    """
+
+    def publish(self, user_ids: Iterable[int], event: Event) -> None:
+        raise NotImplementedError
+
+    def wait(self, user_id: int, timeout: float) -> List[Event]:
+        """
+        Block until there are events for a user or the timeout passes, and return
+        the pending events.
+        """
+        raise NotImplementedError
+
+
+class LocalBroker(Broker):
+    """
+    A broker which keeps the events in process memory. It suits tests and
+    deployments with a single worker.
+    """
+
+    def __init__(self, backlog: int = 100) -> None:
+        self.backlog = backlog
+        self._condition = threading.Condition()
+        self._queues: Dict[int, Deque[Event]] = {}
+
+    def publish(self, user_ids: Iterable[int], event: Event) -> None:
+        with self._condition:
+            for user_id in user_ids:
+                if user_id in self._queues:
+                    self._queues[user_id].append(event)
+            self._condition.notify_all()
+
+    def wait(self, user_id: int, timeout: float) -> List[Event]:
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            queue = self._queues.setdefault(
+                user_id, deque(maxlen=self.backlog)
+            )
+            while not queue:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._condition.wait(remaining)
+            events = list(queue)
+            queue.clear()
+        return events
+
+
+class RedisBroker(Broker):
+    """
+    A broker which keeps the events in per-user Redis lists, so that every worker
+    sees them. It takes a ``redis.Redis`` client, and a user's events expire once
+    they stop waiting for them.
+    """
+
+    __key__ = 'pm_events_{user_id}'
+    __listening_key__ = 'pm_events_{user_id}_listening'
+
+    def __init__(self, client, backlog: int = 100, ttl: int = 300) -> None:
+        self.client = client
+        self.backlog = backlog
+        self.ttl = ttl
+
+    def publish(self, user_ids: Iterable[int], event: Event) -> None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        listening = self.client.mget(
+            *(self.__listening_key__.format(user_id=u) for u in user_ids)
+        )
+        data = json.dumps(event)
+        pipe = self.client.pipeline(transaction=False)
+        for user_id, is_listening in zip(user_ids, listening):
+            if is_listening:
+                key = self.__key__.format(user_id=user_id)
+                pipe.rpush(key, data)
+                pipe.ltrim(key, -self.backlog, -1)
+                pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def wait(self, user_id: int, timeout: float) -> List[Event]:
+        key = self.__key__.format(user_id=user_id)
+        self.client.set(
+            self.__listening_key__.format(user_id=user_id), 1, ex=self.ttl
+        )
+        pending = []
+        if timeout > 0:
+            # BLPOP takes whole seconds, and 0 would block forever.
+            first = self.client.blpop(key, timeout=max(int(timeout), 1))
+            if first is None:
+                return []
+            pending.append(first[1])
+        pipe = self.client.pipeline()
+        pipe.lrange(key, 0, -1)
+        pipe.delete(key)
+        rest, _ = pipe.execute()
+        return [json.loads(data) for data in [*pending, *rest]]
+
+
+def get_broker() -> Broker:
+    return flask.current_app.extensions['messages_broker']
+
+
+def publish(user_ids: Iterable[int], event: Event) -> None:
+    get_broker().publish(user_ids, event)
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import flask
+
+
+class LocalCache:
+    """
+    A bounded, least recently used cache in process memory, in front of the
+    shared cache. Entries expire after ``ttl`` seconds. Callers key entries by
+    cache generation, so a write on another worker makes the old entries
+    unreachable rather than stale; the TTL only bounds how long they are kept.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 5) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+        }
+
+
+def get_local_cache() -> Optional[LocalCache]:
+    return flask.current_app.extensions.get('messages_local_cache')
+
+
+def load(key: str, compute: Callable[[], Any]) -> Any:
+    """
+    Get a value from the local cache, falling back to ``compute`` on a miss or
+    when the local cache is disabled. ``None`` results are not cached.
+    """
+    local = get_local_cache()
+    if local is None:
+        return compute()
+    value = local.get(key)
+    if value is None:
+        value = compute()
+        if value is not None:
+            local.set(key, value)
+    return value
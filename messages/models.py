@@ -1,14 +1,32 @@
-from datetime import datetime
-from typing import List, Optional
+import base64
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
 
 import flask
-from sqlalchemy import and_, exists, func, select
-from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy import (
+    REAL,
+    and_,
+    case,
+    cast,
+    func,
+    literal,
+    literal_column,
+    or_,
+    select,
+    tuple_,
+    union_all,
+)
+from sqlalchemy.dialects.postgresql import array, insert
+from sqlalchemy.orm import make_transient_to_detached
 
-from core import _403Exception, cache, db
+from core import APIException, _403Exception, cache, db
 from core.mixins import MultiPKMixin, SinglePKMixin
 from core.users.models import User
 from core.utils import cached_property
+from messages import compression, local_cache, singleflight, versions
+from messages.events import publish
 from messages.exceptions import PMStateNotFound
 from messages.permissions import MessagePermissions
 from messages.serializers import (
@@ -17,14 +35,66 @@ from messages.serializers import (
 )
 
 
+SEARCH_CONFIG = "'english'::regconfig"
+SNIPPET_LENGTH = 140
+
+
+def _from_cache_data(model, data):
+    """
+    Rebuild a model from its cached column data, attaching it to the session
+    without a round trip. Returns ``None`` if the data is missing or stale.
+    """
+    if not _is_cache_data(model, data):
+        return None
+    obj = model(**data)
+    make_transient_to_detached(obj)
+    return db.session.merge(obj, load=False)
+
+
+def _is_cache_data(model, data) -> bool:
+    """
+    Whether a cached value is column data of a model in its current form.
+    """
+    return isinstance(data, dict) and set(data) == set(
+        model.__table__.columns.keys()
+    )
+
+
+def _cache_data(obj) -> Optional[Dict[str, Any]]:
+    """
+    The column data of a model in the form it is cached, or ``None``.
+    """
+    if obj is None:
+        return None
+    return {c: getattr(obj, c) for c in obj.__table__.columns.keys()}
+
+
+def _validate_users(user_ids: List[int]) -> Dict[int, User]:
+    """
+    Check that all the given users exist, loading them with a single lookup.
+    Returns the users keyed by ID.
+    """
+    users = {u.id: u for u in User.get_many(pks=list(set(user_ids)))}
+    invalid = [str(uid) for uid in user_ids if uid not in users]
+    if invalid:
+        raise APIException(
+            f'The following user_ids are invalid: {", ".join(invalid)}.'
+        )
+    return users
+
+
+def _in_order(models, pks):
+    """
+    Sort models fetched by primary key into the order of the given keys.
+    """
+    by_pk = {m.id: m for m in models}
+    return [by_pk[pk] for pk in pks if pk in by_pk]
+
+
 class PrivateConversation(db.Model, SinglePKMixin):
     __tablename__ = 'pm_conversations'
     __cache_key__ = 'pm_conversations_{id}'
-    __cache_key_of_user__ = 'pm_conversations_users_{user_id}_{filter}'
-    __cache_key_msg_count__ = 'pm_conversations_{id}_messages_count'
-    __cache_key_conv_count__ = (
-        'pm_conversations_{id}_conversations_count_{filter}'
-    )
+    __cache_key_of_user__ = 'pm_conversations_users_{user_id}_{filter}_v{version}'
     __serializer__ = PrivateConversationSerializer
 
     id = db.Column(db.Integer, primary_key=True)
@@ -33,6 +103,10 @@ class PrivateConversation(db.Model, SinglePKMixin):
         db.Integer, db.ForeignKey('users.id'), nullable=False
     )
     locked = db.Column(db.Boolean, nullable=False, server_default='f')
+    last_message_id = db.Column(db.Integer)
+    last_sender_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    last_snippet = db.Column(db.String(SNIPPET_LENGTH))
+    messages_count = db.Column(db.Integer, nullable=False, server_default='0')
 
     @classmethod
     def from_user(
@@ -41,37 +115,110 @@ class PrivateConversation(db.Model, SinglePKMixin):
         page: int = 1,
         limit: int = 50,
         filter: str = 'inbox',
+        cursor: str = None,
     ) -> List['PrivateConversation']:
-        conversations = cls.get_many(
-            key=cls.__cache_key_of_user__.format(
-                user_id=user_id, filter=filter
-            ),
-            filter=cls.id.in_(
-                db.session.query(PrivateConversationState.conv_id).filter(
-                    cls.get_pm_state_filters(user_id, filter)
+        """
+        Get a page of a user's conversations, sticky conversations first and then
+        newest response first. Passing a ``cursor`` from a previous page pages from
+        that conversation rather than by offset.
+        """
+        query = cls.mailbox_query(user_id, filter)
+        if cursor is None:
+            pks = singleflight.load(
+                cls.__cache_key_of_user__.format(
+                    user_id=user_id,
+                    filter=filter,
+                    version=versions.of_user(user_id),
+                ),
+                lambda: [conv_id for conv_id, in query],
+            )
+            start = (page - 1) * limit
+            pks = pks[start:start + limit]
+        else:
+            pks = [
+                conv_id
+                for conv_id, in query.filter(
+                    cls._cursor_filter(cursor)
+                ).limit(limit)
+            ]
+        conversations = _in_order(cls.get_many(pks=pks), pks) if pks else []
+        cls.set_states(conversations, user_id)
+        return conversations
+
+    @classmethod
+    def mailbox_query(cls, user_id: int, filter: str):
+        """
+        Query the IDs of the conversations in a user's mailbox, in mailbox order.
+        """
+        return (
+            db.session.query(PrivateConversationState.conv_id)
+            .filter(cls.get_pm_state_filters(user_id, filter))
+            .order_by(*PrivateConversationState.mailbox_order())
+        )
+
+    @staticmethod
+    def _cursor_filter(cursor: str):
+        """
+        Build the filter selecting the conversations ordered after the one a
+        cursor was made from.
+        """
+        try:
+            sticky, last_response_time, conv_id = json.loads(
+                base64.urlsafe_b64decode(cursor.encode())
+            )
+            if last_response_time is not None:
+                last_response_time = datetime.fromisoformat(
+                    last_response_time
                 )
-            ),
-            page=page,
-            limit=limit,
+            sticky, conv_id = bool(sticky), int(conv_id)
+        except (TypeError, ValueError):
+            raise APIException('Invalid cursor.')
+
+        state = PrivateConversationState
+        if last_response_time is None:
+            tail = and_(
+                state.last_response_time.is_(None), state.conv_id < conv_id
+            )
+        else:
+            tail = or_(
+                state.last_response_time < last_response_time,
+                state.last_response_time.is_(None),
+                and_(
+                    state.last_response_time == last_response_time,
+                    state.conv_id < conv_id,
+                ),
+            )
+        return or_(state.sticky < sticky, and_(state.sticky == sticky, tail))
+
+    @staticmethod
+    def set_states(
+        conversations: List['PrivateConversation'], user_id: int
+    ) -> None:
+        """
+        Assign the states of many conversations for a user at once. The states are
+        loaded in bulk rather than one lookup per conversation.
+        """
+        states = PrivateConversationState.from_conversations(
+            [c.id for c in conversations], user_id
         )
         for conv in conversations:
-            conv.set_state(user_id)
-        return conversations
+            conv._assign_state(states.get(conv.id))
 
     @classmethod
     def count_from_user(cls, user_id: int, filter: str = 'inbox') -> int:
-        return PrivateConversationState.count(
-            key=cls.__cache_key_conv_count__.format(id=user_id, filter=filter),
-            attribute=PrivateConversationState.conv_id,
-            filter=cls.get_pm_state_filters(user_id, filter),
-        )
+        cls.check_filter_permission(filter)
+        return getattr(PrivateMailboxCounts.from_user(user_id), filter)
 
     @staticmethod
-    def get_pm_state_filters(user_id, filter):
+    def check_filter_permission(filter):
         if filter == 'deleted' and not flask.g.user.has_permission(
             MessagePermissions.VIEW_DELETED
         ):
             raise _403Exception
+
+    @classmethod
+    def get_pm_state_filters(cls, user_id, filter):
+        cls.check_filter_permission(filter)
         filters = [
             PrivateConversationState.user_id == user_id,
             PrivateConversationState.deleted
@@ -82,7 +229,7 @@ class PrivateConversation(db.Model, SinglePKMixin):
                 PrivateConversationState.last_response_time.isnot(None)
             )
         elif filter == 'sentbox':
-            filters.append(PrivateConversationState.in_sentbox.is_(True))
+            filters.append(PrivateConversationState.in_sentbox == 't')
         return and_(*filters)
 
     @classmethod
@@ -96,44 +243,316 @@ class PrivateConversation(db.Model, SinglePKMixin):
     ) -> Optional['PrivateConversation']:
         """
         Create a private message object, set states for the sender and receiver,
-        and create the initial message.
+        and create the initial message. Everything is written in one transaction.
         """
-        User.is_valid(sender_id, error=True)
-        for rid in recipient_ids:
-            User.is_valid(rid, error=True)
+        recipient_ids = [
+            rid for rid in dict.fromkeys(recipient_ids) if rid != sender_id
+        ]
+        _validate_users([sender_id, *recipient_ids])
 
-        pm_conversation = super()._new(
-            topic=topic, sender_id=sender_id, locked=locked
+        pm_conversation = cls(topic=topic, sender_id=sender_id, locked=locked)
+        db.session.add(pm_conversation)
+        db.session.flush()
+        db.session.execute(
+            PrivateConversationState.__table__.insert().values(
+                PrivateConversationState.initial_rows(
+                    pm_conversation.id,
+                    sender_id,
+                    recipient_ids,
+                    datetime.utcnow(),
+                )
+            )
         )
-
-        PrivateConversationState.new(
+        message = PrivateMessage(
             conv_id=pm_conversation.id,
             user_id=sender_id,
-            original_member=True,
-            read=True,
+            contents=initial_message,
         )
-        for user_id in recipient_ids:
-            PrivateConversationState.new(
-                conv_id=pm_conversation.id,
-                user_id=user_id,
-                original_member=True,
-            )
+        db.session.add(message)
+        db.session.flush()
+        for key, value in cls.last_message_values(message).items():
+            setattr(pm_conversation, key, value)
+        pm_conversation.messages_count = 1
+        PrivateMailboxCounts.adjust(sender_id, sentbox=1)
+        PrivateMailboxCounts.adjust_many(recipient_ids, inbox=1, unread=1)
+        db.session.commit()
 
-        PrivateMessage.new(
-            conv_id=pm_conversation.id,
-            user_id=sender_id,
-            contents=initial_message,
+        PrivateMailboxCounts.clear_cache_keys([sender_id, *recipient_ids])
+        versions.bump_conversation(
+            pm_conversation.id, [sender_id, *recipient_ids]
+        )
+        publish(
+            recipient_ids,
+            {'event': 'conversation', 'conv_id': pm_conversation.id},
         )
         return pm_conversation
 
     @classmethod
-    def clear_cache_keys(cls, user_id: int):
-        cache.delete_many(
-            *(
-                cls.__cache_key_of_user__.format(user_id=user_id, filter=f)
-                for f in ['inbox', 'sentbox', 'deleted']
+    def broadcast(
+        cls,
+        topic: str,
+        sender_id: int,
+        recipient_ids: List[int],
+        message: str,
+        chunk_size: int = 1000,
+    ) -> Dict[str, Any]:
+        """
+        Send a message to many users, each in their own conversation with the sender.
+        The rows are inserted in bulk, committing once per chunk of recipients.
+        Returns the number of conversations created and the throughput.
+        """
+        started = time.monotonic()
+        recipient_ids = [
+            rid for rid in dict.fromkeys(recipient_ids) if rid != sender_id
+        ]
+        _validate_users([sender_id, *recipient_ids])
+        for start in range(0, len(recipient_ids), chunk_size):
+            end = start + chunk_size
+            cls._broadcast_chunk(
+                topic, sender_id, recipient_ids[start:end], message
+            )
+        elapsed = time.monotonic() - started
+        return {
+            'conversations': len(recipient_ids),
+            'seconds': round(elapsed, 3),
+            'per_second': round(len(recipient_ids) / elapsed, 1)
+            if elapsed
+            else None,
+        }
+
+    @classmethod
+    def _broadcast_chunk(
+        cls,
+        topic: str,
+        sender_id: int,
+        recipient_ids: List[int],
+        message: str,
+    ) -> None:
+        conv_ids = [
+            id_
+            for id_, in db.session.execute(
+                select([func.nextval('pm_conversations_id_seq')]).select_from(
+                    func.generate_series(1, len(recipient_ids))
+                )
+            )
+        ]
+        message_ids = [
+            id_
+            for id_, in db.session.execute(
+                select([func.nextval('pm_messages_id_seq')]).select_from(
+                    func.generate_series(1, len(recipient_ids))
+                )
+            )
+        ]
+        now = datetime.utcnow()
+        snippet = cls.snippet(message)
+        db.session.execute(
+            cls.__table__.insert().values(
+                [
+                    {
+                        'id': conv_id,
+                        'topic': topic,
+                        'sender_id': sender_id,
+                        'last_message_id': message_id,
+                        'last_sender_id': sender_id,
+                        'last_snippet': snippet,
+                        'messages_count': 1,
+                    }
+                    for conv_id, message_id in zip(conv_ids, message_ids)
+                ]
             )
         )
+        states = []
+        for conv_id, recipient_id in zip(conv_ids, recipient_ids):
+            states.extend(
+                PrivateConversationState.initial_rows(
+                    conv_id, sender_id, [recipient_id], now
+                )
+            )
+        db.session.execute(
+            PrivateConversationState.__table__.insert().values(states)
+        )
+        db.session.execute(
+            PrivateMessage.__table__.insert().values(
+                [
+                    {
+                        'id': message_id,
+                        'conv_id': conv_id,
+                        'user_id': sender_id,
+                        '_contents': PrivateMessage.compress(message),
+                    }
+                    for conv_id, message_id in zip(conv_ids, message_ids)
+                ]
+            )
+        )
+        PrivateMailboxCounts.adjust(sender_id, sentbox=len(conv_ids))
+        PrivateMailboxCounts.adjust_many(recipient_ids, inbox=1, unread=1)
+        db.session.commit()
+        PrivateMailboxCounts.clear_cache_keys([sender_id, *recipient_ids])
+        versions.bump_users([sender_id, *recipient_ids])
+        publish(recipient_ids, {'event': 'broadcast', 'topic': topic})
+
+    @staticmethod
+    def snippet(contents: str) -> str:
+        """
+        A preview of message contents for mailbox listings, on one line.
+        """
+        return ' '.join(contents.split())[:SNIPPET_LENGTH]
+
+    @classmethod
+    def last_message_values(cls, message: 'PrivateMessage') -> Dict[str, Any]:
+        return {
+            'last_message_id': message.id,
+            'last_sender_id': message.user_id,
+            'last_snippet': cls.snippet(message.contents),
+        }
+
+    @classmethod
+    def add_message(cls, message: 'PrivateMessage') -> None:
+        """
+        Count a new message in its conversation and record it as the last one, in
+        the caller's transaction. The last message is left alone if it is newer,
+        so that concurrent replies cannot go back in time.
+        """
+        newer = func.coalesce(cls.last_message_id, 0) < message.id
+        db.session.execute(
+            cls.__table__.update()
+            .where(cls.id == message.conv_id)
+            .values(
+                messages_count=cls.messages_count + 1,
+                **{
+                    key: case([(newer, value)], else_=getattr(cls, key))
+                    for key, value in cls.last_message_values(message).items()
+                },
+            )
+        )
+
+    @classmethod
+    def recount_messages(cls) -> List[int]:
+        """
+        Recompute the message count of every conversation, archived messages
+        included, in the caller's transaction. Returns the IDs of the conversations
+        whose count changed, whose cache keys the caller clears after committing.
+        """
+        hot, archived = (
+            select([func.count(model.id)])
+            .where(model.conv_id == cls.id)
+            .as_scalar()
+            for model in (PrivateMessage, PrivateMessageArchive)
+        )
+        result = db.session.execute(
+            cls.__table__.update()
+            .where(cls.messages_count != hot + archived)
+            .values(messages_count=hot + archived)
+            .returning(cls.id)
+        )
+        return [conv_id for conv_id, in result]
+
+    @classmethod
+    def refresh_last_messages(cls) -> List[int]:
+        """
+        Recompute the last message of every conversation from the messages table,
+        in the caller's transaction. Returns the IDs of the conversations whose
+        preview changed, whose cache keys the caller clears after committing.
+        """
+        latest = (
+            select(
+                [
+                    PrivateMessage.conv_id,
+                    PrivateMessage.id,
+                    PrivateMessage.user_id,
+                    PrivateMessage._contents.label('contents'),
+                ]
+            )
+            .distinct(PrivateMessage.conv_id)
+            .order_by(PrivateMessage.conv_id, PrivateMessage.id.desc())
+            .alias('latest')
+        )
+        compressed = latest.c.contents.startswith(compression.MARKER)
+        snippet = func.left(
+            func.btrim(
+                func.regexp_replace(latest.c.contents, r'\s+', ' ', 'g')
+            ),
+            SNIPPET_LENGTH,
+        )
+        result = db.session.execute(
+            cls.__table__.update()
+            .where(
+                and_(
+                    cls.id == latest.c.conv_id,
+                    or_(
+                        cls.last_message_id.is_distinct_from(latest.c.id),
+                        cls.last_sender_id.is_distinct_from(latest.c.user_id),
+                        and_(
+                            ~compressed,
+                            cls.last_snippet.is_distinct_from(snippet),
+                        ),
+                    ),
+                )
+            )
+            .values(
+                last_message_id=latest.c.id,
+                last_sender_id=latest.c.user_id,
+                last_snippet=case([(compressed, None)], else_=snippet),
+            )
+            .returning(cls.id)
+        )
+        conv_ids = [conv_id for conv_id, in result]
+        # Compressed contents can only be previewed once decompressed.
+        for message in PrivateMessage.query.filter(
+            and_(
+                PrivateMessage.id.in_(
+                    select([cls.last_message_id]).where(
+                        and_(
+                            cls.last_message_id.isnot(None),
+                            cls.last_snippet.is_(None),
+                        )
+                    )
+                ),
+                PrivateMessage._contents.startswith(compression.MARKER),
+            )
+        ):
+            db.session.execute(
+                cls.__table__.update()
+                .where(cls.id == message.conv_id)
+                .values(last_snippet=cls.snippet(message.contents))
+            )
+            conv_ids.append(message.conv_id)
+        return list(dict.fromkeys(conv_ids))
+
+    @staticmethod
+    def clear_cache_keys(user_id: int):
+        """
+        Invalidate every cached listing of a user's conversations by moving the
+        user to a new cache generation.
+        """
+        versions.bump_users([user_id])
+
+    @classmethod
+    def clear_conversation_cache_keys(cls, conv_ids: List[int]) -> None:
+        """
+        Invalidate the caches of conversations changed outside of the usual writes,
+        such as a repair. Their members' mailboxes show them, so the members move
+        to new cache generations along with the conversations.
+        """
+        if not conv_ids:
+            return
+        cache.delete_many(
+            *(cls.__cache_key__.format(id=conv_id) for conv_id in conv_ids)
+        )
+        state = PrivateConversationState
+        user_ids = [
+            user_id
+            for user_id, in db.session.query(state.user_id)
+            .filter(state.conv_id.in_(conv_ids))
+            .distinct()
+        ]
+        versions.bump(
+            [
+                *(versions.conversation_key(c) for c in conv_ids),
+                *(versions.user_key(u) for u in user_ids),
+            ]
+        )
 
     @property
     def messages(self):
@@ -141,28 +560,51 @@ class PrivateConversation(db.Model, SinglePKMixin):
             self.set_messages()
         return self._messages
 
+    @property
+    def messages_cursor(self) -> Optional[int]:
+        """
+        The message ID to page from for the next page of messages, or ``None`` if
+        the current page is the last one.
+        """
+        if not hasattr(self, '_messages_cursor'):
+            self.set_messages()
+        return self._messages_cursor
+
     @cached_property
     def members(self):
         return PrivateConversationState.get_users_in_conversation(self.id)
 
-    @cached_property
-    def messages_count(self):
-        return PrivateMessage.count(
-            key=self.__cache_key_msg_count__.format(id=self.id),
-            attribute=PrivateMessage.id,
-            filter=PrivateMessage.conv_id == self.id,
-        )
-
     def set_state(self, user_id):
         """
         Assign the state of the PM for a user to attributes of this object. This makes
         the object suitable for serialization.
         """
-        self._conv_state = PrivateConversationState.from_attrs(
-            conv_id=self.id, user_id=user_id
+        self._assign_state(
+            PrivateConversationState.from_conversation(self.id, user_id)
         )
-        if not self._conv_state:
+
+    @property
+    def cursor(self) -> str:
+        """
+        An opaque cursor for paging a user's conversations from this one. The state
+        must be set first.
+        """
+        return base64.urlsafe_b64encode(
+            json.dumps(
+                [
+                    self.sticky,
+                    self.last_response_time.isoformat()
+                    if self.last_response_time
+                    else None,
+                    self.id,
+                ]
+            ).encode()
+        ).decode()
+
+    def _assign_state(self, state: 'PrivateConversationState') -> None:
+        if not state:
             raise PMStateNotFound
+        self._conv_state = state
         self.read = self._conv_state.read
         self.sticky = self._conv_state.sticky
         self.last_response_time = self._conv_state.last_response_time
@@ -170,12 +612,33 @@ class PrivateConversation(db.Model, SinglePKMixin):
     def mark_read(self):
         if not self._conv_state:
             raise PMStateNotFound
-        self._conv_state.read = True
+        state = self._conv_state
+        was_read = state.read
+        if not was_read:
+            state.read = True
+            if not state.deleted and state.last_response_time is not None:
+                PrivateMailboxCounts.adjust(state.user_id, unread=-1)
         self.read = True
         db.session.commit()
+        PrivateMailboxCounts.clear_cache_keys([state.user_id])
+        if not was_read:
+            versions.bump_users([state.user_id])
 
-    def set_messages(self, page: int = 1, limit: int = 50) -> None:
-        self._messages = PrivateMessage.from_conversation(self.id, page, limit)
+    def set_messages(
+        self,
+        page: int = 1,
+        limit: int = 50,
+        after_id: int = None,
+        before_id: int = None,
+    ) -> None:
+        self._messages = PrivateMessage.from_conversation(
+            self.id, page, limit, after_id=after_id, before_id=before_id
+        )
+        self._messages_cursor = None
+        if len(self._messages) == limit:
+            self._messages_cursor = self._messages[
+                0 if before_id is not None else -1
+            ].id
 
     def belongs_to_user(self) -> bool:
         """
@@ -189,7 +652,7 @@ class PrivateConversation(db.Model, SinglePKMixin):
 class PrivateConversationState(db.Model, MultiPKMixin):
     __tablename__ = 'pm_conversations_state'
     __cache_key__ = 'pm_convesations_state_{conv_id}_{user_id}'
-    __cache_key_members__ = 'pm_conversations_state_{conv_id}_members'
+    __cache_key_members__ = 'pm_conversations_state_{conv_id}_members_v{version}'
 
     conv_id = db.Column(
         db.Integer, db.ForeignKey('pm_conversations.id'), primary_key=True
@@ -199,30 +662,126 @@ class PrivateConversationState(db.Model, MultiPKMixin):
     )
     original_member = db.Column(db.Boolean, nullable=False)
     read = db.Column(db.Boolean, nullable=False, server_default='f')
-    sticky = db.Column(
-        db.Boolean, nullable=False, server_default='f', index=True
-    )
-    deleted = db.Column(
-        db.Boolean, nullable=False, server_default='f', index=True
-    )
+    sticky = db.Column(db.Boolean, nullable=False, server_default='f')
+    deleted = db.Column(db.Boolean, nullable=False, server_default='f')
     time_added = db.Column(
         db.DateTime(timezone=True), nullable=False, server_default=func.now()
     )
     last_response_time = db.Column(db.DateTime(timezone=True))
+    in_sentbox = db.Column(db.Boolean, nullable=False, server_default='f')
 
-    @hybrid_property
-    def in_sentbox(cls):
-        return select(
-            [
-                exists().where(
-                    and_(
-                        PrivateMessage.conv_id == cls.conv_id,
-                        PrivateMessage.user_id == cls.user_id,
-                        cls.deleted == 'f',
-                    )
-                )
-            ]
-        ).as_scalar()
+    @classmethod
+    def mailbox_order(cls):
+        """
+        The order conversations are listed in a user's mailbox. The mailbox indexes
+        on this table are built in this order.
+        """
+        return (
+            cls.sticky.desc(),
+            cls.last_response_time.desc().nullslast(),
+            cls.conv_id.desc(),
+        )
+
+    @classmethod
+    def from_conversation(
+        cls, conv_id: int, user_id: int
+    ) -> Optional['PrivateConversationState']:
+        """
+        Get a user's state for a conversation. Concurrent cache misses for the same
+        state are loaded from the database once.
+        """
+        key = cls.create_cache_key({'conv_id': conv_id, 'user_id': user_id})
+        conv_version, user_version = versions.get(
+            versions.conversation_key(conv_id), versions.user_key(user_id)
+        )
+
+        def query():
+            return _cache_data(
+                db.session.query(cls)
+                .filter(and_(cls.conv_id == conv_id, cls.user_id == user_id))
+                .one_or_none()
+            )
+
+        def load():
+            data = singleflight.load(key, query)
+            if data is not None and not _is_cache_data(cls, data):
+                # Cached in another form, e.g. as a model or before a migration.
+                data = query()
+                if data is not None:
+                    cache.set(key, data)
+            return data
+
+        return _from_cache_data(
+            cls,
+            local_cache.load(f'{key}_v{conv_version}_{user_version}', load),
+        )
+
+    @classmethod
+    def from_conversations(
+        cls, conv_ids: List[int], user_id: int
+    ) -> Dict[int, 'PrivateConversationState']:
+        """
+        Get a user's states for many conversations, keyed by conversation ID. Cached
+        states are fetched with one multi-get and the misses with one query.
+        """
+        keys = {
+            conv_id: cls.create_cache_key(
+                {'conv_id': conv_id, 'user_id': user_id}
+            )
+            for conv_id in conv_ids
+        }
+        cached = cache.get_dict(*keys.values()) if keys else {}
+        states = {}
+        for conv_id, key in keys.items():
+            state = _from_cache_data(cls, cached.get(key))
+            if state is not None:
+                states[conv_id] = state
+
+        missing = [conv_id for conv_id in keys if conv_id not in states]
+        if missing:
+            loaded = db.session.query(cls).filter(
+                and_(cls.conv_id.in_(missing), cls.user_id == user_id)
+            )
+            to_cache = {}
+            for state in loaded:
+                states[state.conv_id] = state
+                to_cache[keys[state.conv_id]] = _cache_data(state)
+            if to_cache:
+                cache.set_many(to_cache)
+        return states
+
+    @staticmethod
+    def initial_rows(
+        conv_id: int,
+        sender_id: int,
+        recipient_ids: List[int],
+        response_time: datetime,
+    ) -> List[Dict[str, Any]]:
+        """
+        Build the state rows of a new conversation for a bulk insert. The sender has
+        posted the first message, which the recipients have yet to read.
+        """
+        return [
+            {
+                'conv_id': conv_id,
+                'user_id': sender_id,
+                'original_member': True,
+                'read': True,
+                'in_sentbox': True,
+                'last_response_time': None,
+            },
+            *(
+                {
+                    'conv_id': conv_id,
+                    'user_id': user_id,
+                    'original_member': True,
+                    'read': False,
+                    'in_sentbox': False,
+                    'last_response_time': response_time,
+                }
+                for user_id in recipient_ids
+            ),
+        ]
 
     @classmethod
     def get_users_in_conversation(cls, conv_id: int) -> List[User]:
@@ -230,11 +789,20 @@ class PrivateConversationState(db.Model, MultiPKMixin):
 
     @classmethod
     def get_user_ids_in_conversation(cls, conv_id: int) -> List[int]:
-        return cls.get_col_from_many(
-            column=cls.user_id,
-            key=cls.__cache_key_members__.format(conv_id=conv_id),
-            filter=and_(cls.conv_id == conv_id, cls.deleted == 'f'),
-            order=cls.time_added.asc(),
+        key = cls.__cache_key_members__.format(
+            conv_id=conv_id, version=versions.of_conversation(conv_id)
+        )
+        return local_cache.load(
+            key,
+            lambda: singleflight.load(
+                key,
+                lambda: [
+                    user_id
+                    for user_id, in db.session.query(cls.user_id)
+                    .filter(and_(cls.conv_id == conv_id, cls.deleted == 'f'))
+                    .order_by(cls.time_added.asc())
+                ],
+            ),
         )
 
     @classmethod
@@ -251,41 +819,268 @@ class PrivateConversationState(db.Model, MultiPKMixin):
         """
         PrivateConversation.is_valid(conv_id, error=True)
         User.is_valid(user_id, error=True)
-        cache.delete(cls.__cache_key_members__.format(conv_id=conv_id))
-        return super()._new(
+        state = super()._new(
             conv_id=conv_id,
             user_id=user_id,
             original_member=original_member,
             read=read,
         )
+        cls.clear_member_cache_keys(conv_id, [user_id])
+        publish([user_id], {'event': 'conversation', 'conv_id': conv_id})
+        return state
 
     @classmethod
-    def update_last_response_time(cls, conv_id: int, sender_id: int) -> None:
+    def add_to_sentbox(cls, conv_id: int, user_id: int) -> bool:
+        """
+        Put a conversation in a user's sentbox when they first post in it. Returns
+        whether it was added to a sentbox the user can see.
+        """
+        added = db.session.execute(
+            cls.__table__.update()
+            .where(
+                and_(
+                    cls.conv_id == conv_id,
+                    cls.user_id == user_id,
+                    cls.in_sentbox == 'f',
+                )
+            )
+            .values(in_sentbox=True)
+            .returning(cls.deleted)
+        ).fetchone()
+        return added is not None and not added.deleted
+
+    @classmethod
+    def add_many(cls, conv_id: int, user_ids: List[int]) -> None:
+        """
+        Add many users to a conversation. Users who were removed from it before are
+        brought back. Raises an APIException if any of them is already a member.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        users = _validate_users(user_ids)
+        existing = {
+            st.user_id: st
+            for st in db.session.query(cls).filter(
+                and_(cls.conv_id == conv_id, cls.user_id.in_(user_ids))
+            )
+        }
+        already_members = [
+            users[uid].username
+            for uid in user_ids
+            if uid in existing and not existing[uid].deleted
+        ]
+        if already_members:
+            raise APIException(
+                'The following members are already in the conversation: '
+                f'{", ".join(already_members)}.'
+            )
+
+        new_ids = [uid for uid in user_ids if uid not in existing]
+        if new_ids:
+            db.session.execute(
+                cls.__table__.insert().values(
+                    [
+                        {
+                            'conv_id': conv_id,
+                            'user_id': uid,
+                            'original_member': False,
+                        }
+                        for uid in new_ids
+                    ]
+                )
+            )
+        rejoined_ids = [uid for uid in user_ids if uid in existing]
+        recounted_ids = []
+        if rejoined_ids:
+            db.session.query(cls).filter(
+                and_(cls.conv_id == conv_id, cls.user_id.in_(rejoined_ids))
+            ).update({'deleted': False}, synchronize_session=False)
+            recounted_ids = PrivateMailboxCounts.recount(rejoined_ids)
+        db.session.commit()
+        PrivateMailboxCounts.clear_cache_keys(recounted_ids)
+        cls.clear_member_cache_keys(conv_id, user_ids)
+        publish(user_ids, {'event': 'conversation', 'conv_id': conv_id})
+
+    @classmethod
+    def remove_many(cls, conv_id: int, user_ids: List[int]) -> None:
+        """
+        Remove many users from a conversation. Raises an APIException if any of them
+        is not a member, or is an original member.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        states = {
+            st.user_id: st
+            for st in db.session.query(cls).filter(
+                and_(
+                    cls.conv_id == conv_id,
+                    cls.user_id.in_(user_ids),
+                    cls.deleted == 'f',
+                )
+            )
+        }
+        not_members = [str(uid) for uid in user_ids if uid not in states]
+        if not_members:
+            raise APIException(
+                'The following user_ids are not in the conversation: '
+                f'{", ".join(not_members)}.'
+            )
+        og_member_ids = [
+            uid for uid in user_ids if states[uid].original_member
+        ]
+        if og_member_ids:
+            users = {u.id: u for u in User.get_many(pks=og_member_ids)}
+            raise APIException(
+                'The following original members cannot be removed from the conversation: '
+                f'{", ".join(users[uid].username for uid in og_member_ids)}.'
+            )
+
         db.session.query(cls).filter(
-            and_(cls.conv_id == conv_id, cls.user_id != sender_id)
-        ).update({'last_response_time': datetime.utcnow()})
+            and_(cls.conv_id == conv_id, cls.user_id.in_(user_ids))
+        ).update({'deleted': True}, synchronize_session=False)
+        recounted_ids = PrivateMailboxCounts.recount(user_ids)
         db.session.commit()
+        PrivateMailboxCounts.clear_cache_keys(recounted_ids)
+        cls.clear_member_cache_keys(conv_id, user_ids)
+
+    @classmethod
+    def clear_member_cache_keys(
+        cls, conv_id: int, user_ids: List[int]
+    ) -> None:
+        """
+        Invalidate the caches of a conversation whose members changed. Every
+        member's mailbox lists the members, so all of their versions move, along
+        with those of the users who were added or removed.
+        """
         cache.delete_many(
             *(
                 cls.create_cache_key({'conv_id': conv_id, 'user_id': uid})
-                for uid in cls.get_user_ids_in_conversation(conv_id)
-                if uid != sender_id
+                for uid in user_ids
+            )
+        )
+        member_ids = [
+            user_id
+            for user_id, in db.session.query(cls.user_id).filter(
+                and_(cls.conv_id == conv_id, cls.deleted == 'f')
+            )
+        ]
+        versions.bump_conversation(
+            conv_id, list(dict.fromkeys([*user_ids, *member_ids]))
+        )
+
+    @classmethod
+    def modify_many(
+        cls,
+        user_id: int,
+        conv_ids: List[int],
+        read: bool = None,
+        deleted: bool = None,
+    ) -> List[int]:
+        """
+        Mark many of a user's conversations as read and/or deleted with a single
+        statement, in the caller's transaction. Conversations the user is not a
+        member of, or has deleted, are left alone. Returns the IDs of the
+        conversations that were modified.
+        """
+        values = {}
+        if read:
+            values['read'] = True
+        if deleted:
+            values['deleted'] = True
+        stmt = cls.__table__.update().where(
+            and_(
+                cls.user_id == user_id,
+                cls.conv_id.in_(conv_ids),
+                cls.deleted == 'f',
             )
         )
+        stmt = stmt.values(**(values or {'read': cls.read}))
+        result = db.session.execute(stmt.returning(cls.conv_id))
+        return [conv_id for conv_id, in result]
 
+    @classmethod
+    def clear_cache_keys(cls, user_id: int, conv_ids: List[int]) -> None:
+        cache.delete_many(
+            *(
+                cls.create_cache_key({'conv_id': conv_id, 'user_id': user_id})
+                for conv_id in conv_ids
+            )
+        )
+        versions.bump_users([user_id])
 
-class PrivateMessage(db.Model, SinglePKMixin):
+    @classmethod
+    def update_last_response_time(
+        cls, conv_id: int, sender_id: int
+    ) -> Dict[int, bool]:
+        """
+        Mark a conversation as responded to and unread for every member but the
+        sender, in the caller's transaction. Returns whether each of those members
+        was removed from the conversation, keyed by user ID.
+        """
+        result = db.session.execute(
+            cls.__table__.update()
+            .where(and_(cls.conv_id == conv_id, cls.user_id != sender_id))
+            .values(last_response_time=datetime.utcnow(), read=False)
+            .returning(cls.user_id, cls.deleted)
+        )
+        return {user_id: deleted for user_id, deleted in result}
+
+
+db.Index(
+    'ix_pm_conversations_state_mailbox',
+    PrivateConversationState.user_id,
+    PrivateConversationState.deleted,
+    *PrivateConversationState.mailbox_order(),
+)
+db.Index(
+    'ix_pm_conversations_state_inbox',
+    PrivateConversationState.user_id,
+    *PrivateConversationState.mailbox_order(),
+    postgresql_where=and_(
+        PrivateConversationState.deleted == 'f',
+        PrivateConversationState.last_response_time.isnot(None),
+    ),
+)
+db.Index(
+    'ix_pm_conversations_state_sentbox',
+    PrivateConversationState.user_id,
+    *PrivateConversationState.mailbox_order(),
+    postgresql_where=and_(
+        PrivateConversationState.in_sentbox == 't',
+        PrivateConversationState.deleted == 'f',
+    ),
+)
+
+
+class CompressedContentsMixin:
+    """
+    Message contents which are stored compressed once they reach the
+    ``MESSAGES_COMPRESS_THRESHOLD`` setting, in bytes. The stored form is what
+    the database and the cache hold; it is only decompressed when the contents
+    are read.
+    """
+
+    @property
+    def contents(self) -> str:
+        return compression.decompress(self._contents)
+
+    @contents.setter
+    def contents(self, value: str) -> None:
+        self._contents = self.compress(value)
+
+    @staticmethod
+    def compress(contents: str) -> str:
+        threshold = flask.current_app.config.get('MESSAGES_COMPRESS_THRESHOLD')
+        return compression.compress(contents, threshold)
+
+
+class PrivateMessage(db.Model, SinglePKMixin, CompressedContentsMixin):
     __tablename__ = 'pm_messages'
     __cache_key__ = 'pm_messages_{id}'
-    __cache_key_of_conversation__ = 'pm_messages_conv_{conv_id}'
+    __cache_key_of_conversation__ = 'pm_messages_conv_{conv_id}_v{version}'
     __serializer__ = PrivateMessageSerializer
 
     id = db.Column(db.Integer, primary_key=True)
     conv_id = db.Column(
-        db.Integer,
-        db.ForeignKey('pm_conversations.id'),
-        nullable=False,
-        index=True,
+        db.Integer, db.ForeignKey('pm_conversations.id'), nullable=False
     )
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     time = db.Column(
@@ -294,37 +1089,469 @@ class PrivateMessage(db.Model, SinglePKMixin):
         index=True,
         server_default=func.now(),
     )
-    contents = db.Column(db.Text, nullable=False)
+    _contents = db.Column(
+        'contents', db.Text, key='_contents', nullable=False
+    )
 
     @classmethod
     def from_conversation(
-        cls, conv_id: int, page: int = 1, limit: int = 50
+        cls,
+        conv_id: int,
+        page: int = 1,
+        limit: int = 50,
+        after_id: int = None,
+        before_id: int = None,
     ) -> List['PrivateMessage']:
         """
-        Get a list of private messages in a conversation.
+        Get a list of private messages in a conversation. Passing ``after_id`` or
+        ``before_id`` pages by message ID instead of by offset, so deep pages cost
+        the same as the first one. Archived messages are included.
+        """
+        if after_id is None and before_id is None:
+            key = cls.__cache_key_of_conversation__.format(
+                conv_id=conv_id, version=versions.of_conversation(conv_id)
+            )
+            pks = singleflight.load(
+                key,
+                lambda: [
+                    id_
+                    for id_, in db.session.execute(cls.history_ids(conv_id))
+                ],
+            )
+            start = (page - 1) * limit
+            pks = pks[start:start + limit]
+        else:
+            stmt = cls.history_ids(
+                conv_id, after_id=after_id, before_id=before_id
+            )
+            pks = sorted(id_ for id_, in db.session.execute(stmt.limit(limit)))
+        messages = cls.from_history(pks)
+        cls.set_users(messages)
+        return messages
+
+    @classmethod
+    def from_history(cls, pks: List[int]) -> List['PrivateMessage']:
+        """
+        Get messages by ID from the hot table, falling back to the archive for the
+        ones that have been archived.
+        """
+        if not pks:
+            return []
+        messages = cls.get_many(pks=pks)
+        missing = set(pks) - {m.id for m in messages}
+        if missing:
+            messages.extend(
+                PrivateMessageArchive.query.filter(
+                    PrivateMessageArchive.id.in_(missing)
+                )
+            )
+        return _in_order(messages, pks)
+
+    @classmethod
+    def history_ids(
+        cls, conv_id: int, after_id: int = None, before_id: int = None
+    ):
+        """
+        Select the IDs of the messages in a conversation from both the hot table and
+        the archive, oldest first, or nearest first when paging after or before a
+        message. Each side is served by its ``(conv_id, id)`` index.
         """
-        return cls.get_many(
-            key=cls.__cache_key_of_conversation__.format(conv_id=conv_id),
-            filter=cls.conv_id == conv_id,
-            order=cls.id.asc(),
-            page=page,
-            limit=limit,
+        selects = []
+        for model in (cls, PrivateMessageArchive):
+            stmt = select([model.id.label('id')]).where(
+                model.conv_id == conv_id
+            )
+            if after_id is not None:
+                stmt = stmt.where(model.id > after_id)
+            elif before_id is not None:
+                stmt = stmt.where(model.id < before_id)
+            selects.append(stmt)
+        order = literal_column('id')
+        return union_all(*selects).order_by(
+            order.desc() if before_id is not None else order.asc()
         )
 
+    @classmethod
+    def search(
+        cls, user_id: int, terms: str, limit: int = 50, cursor: str = None
+    ) -> List['PrivateMessage']:
+        """
+        Search the messages of the conversations a user has not deleted, best match
+        first. Passing a ``cursor`` from a previous page pages from that message.
+        """
+        results = cls.search_query(user_id, terms, cursor).limit(limit).all()
+        pks = [id_ for id_, _ in results]
+        messages = _in_order(cls.get_many(pks=pks), pks) if pks else []
+        ranks = dict(results)
+        for message in messages:
+            message.search_rank = ranks[message.id]
+        cls.set_users(messages)
+        return messages
+
+    @classmethod
+    def search_query(cls, user_id: int, terms: str, cursor: str = None):
+        """
+        Query the IDs and ranks of the messages matching the search terms in a user's
+        conversations. The match is served by the full text index on the message
+        contents.
+        """
+        vector = cls.search_vector()
+        tsquery = func.plainto_tsquery(literal_column(SEARCH_CONFIG), terms)
+        rank = func.ts_rank(vector, tsquery)
+        query = (
+            db.session.query(cls.id, rank)
+            .join(
+                PrivateConversationState,
+                and_(
+                    PrivateConversationState.conv_id == cls.conv_id,
+                    PrivateConversationState.user_id == user_id,
+                    PrivateConversationState.deleted == 'f',
+                ),
+            )
+            .filter(vector.op('@@')(tsquery))
+            .order_by(rank.desc(), cls.id.desc())
+        )
+        if cursor is not None:
+            try:
+                cursor_rank, cursor_id = json.loads(
+                    base64.urlsafe_b64decode(cursor.encode())
+                )
+                cursor_rank, cursor_id = float(cursor_rank), int(cursor_id)
+            except (TypeError, ValueError):
+                raise APIException('Invalid cursor.')
+            # ts_rank is a real; compare the cursor as one too, or the widened
+            # value no longer equals the ranks it was read from.
+            query = query.filter(
+                tuple_(rank, cls.id)
+                < tuple_(cast(literal(cursor_rank), REAL), cursor_id)
+            )
+        return query
+
+    @classmethod
+    def search_vector(cls):
+        return func.to_tsvector(literal_column(SEARCH_CONFIG), cls._contents)
+
+    @property
+    def search_cursor(self) -> str:
+        """
+        An opaque cursor for paging search results from this message. The message
+        must come from a search.
+        """
+        return base64.urlsafe_b64encode(
+            json.dumps([self.search_rank, self.id]).encode()
+        ).decode()
+
     @classmethod
     def new(
         cls, conv_id: int, user_id: int, contents: str
     ) -> Optional['PrivateMessage']:
         """
-        Create a message in a PM conversation.
+        Create a message in a PM conversation, updating the states of its members in
+        the same transaction.
         """
         PrivateConversation.is_valid(conv_id, error=True)
         User.is_valid(user_id, error=True)
-        PrivateConversationState.update_last_response_time(conv_id, user_id)
-        return super()._new(
-            conv_id=conv_id, user_id=user_id, contents=contents
+        counted_user_ids = PrivateMailboxCounts.count_message(conv_id, user_id)
+        if PrivateConversationState.add_to_sentbox(conv_id, user_id):
+            PrivateMailboxCounts.adjust(user_id, sentbox=1)
+            counted_user_ids.append(user_id)
+        members = PrivateConversationState.update_last_response_time(
+            conv_id, user_id
+        )
+        member_ids = [uid for uid, deleted in members.items() if not deleted]
+        message = cls(conv_id=conv_id, user_id=user_id, contents=contents)
+        db.session.add(message)
+        db.session.flush()
+        PrivateConversation.add_message(message)
+        db.session.commit()
+
+        cache.delete_many(
+            PrivateConversation.__cache_key__.format(id=conv_id),
+            *(
+                PrivateConversationState.create_cache_key(
+                    {'conv_id': conv_id, 'user_id': uid}
+                )
+                for uid in [user_id, *members]
+            ),
+            *(
+                PrivateMailboxCounts.create_cache_key({'user_id': uid})
+                for uid in counted_user_ids
+            ),
+        )
+        versions.bump_conversation(conv_id, [user_id, *member_ids])
+        publish(
+            member_ids,
+            {'event': 'message', 'conv_id': conv_id, 'message_id': message.id},
         )
+        return message
+
+    @staticmethod
+    def set_users(messages: List['PrivateMessage']) -> None:
+        """
+        Load the authors of many messages with a single lookup and attach them, so
+        that serializing the messages does not look up each author separately.
+        """
+        if not messages:
+            return
+        users = {
+            u.id: u
+            for u in User.get_many(pks=list({m.user_id for m in messages}))
+        }
+        for message in messages:
+            if message.user_id in users:
+                message.user = users[message.user_id]
+
+    @cached_property
+    def user(self):
+        return User.from_pk(self.user_id)
+
+
+db.Index(
+    'ix_pm_messages_conv_id_id', PrivateMessage.conv_id, PrivateMessage.id
+)
+db.Index(
+    'ix_pm_messages_contents_search',
+    PrivateMessage.search_vector(),
+    postgresql_using='gin',
+)
+
+
+class PrivateMessageArchive(
+    db.Model, SinglePKMixin, CompressedContentsMixin
+):
+    """
+    Messages moved out of ``pm_messages`` once they are old, which keeps the hot
+    table and its indexes small. Reads of a conversation's history include these
+    transparently.
+    """
+
+    __tablename__ = 'pm_messages_archive'
+    __cache_key__ = 'pm_messages_archive_{id}'
+    __serializer__ = PrivateMessageSerializer
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    conv_id = db.Column(
+        db.Integer, db.ForeignKey('pm_conversations.id'), nullable=False
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    time = db.Column(db.DateTime(timezone=True), nullable=False)
+    _contents = db.Column(
+        'contents', db.Text, key='_contents', nullable=False
+    )
+
+    @classmethod
+    def archive(cls, older_than: timedelta, chunk_size: int = 10000) -> int:
+        """
+        Move the messages older than an age from the hot table to the archive, a
+        chunk per transaction so that no lock is held for long. The conversations
+        of the moved messages move to new cache generations. Returns the number of
+        messages moved.
+        """
+        cutoff = datetime.utcnow() - older_than
+        hot = PrivateMessage.__table__
+        columns = ['id', 'conv_id', 'user_id', 'time', '_contents']
+        moved_count = 0
+        while True:
+            chunk = (
+                select([hot.c.id])
+                .where(hot.c.time < cutoff)
+                .order_by(hot.c.time)
+                .limit(chunk_size)
+                .with_for_update(skip_locked=True)
+            )
+            moved = (
+                hot.delete()
+                .where(hot.c.id.in_(chunk))
+                .returning(*(hot.c[c] for c in columns))
+                .cte('moved')
+            )
+            result = db.session.execute(
+                cls.__table__.insert()
+                .from_select(columns, select([moved.c[c] for c in columns]))
+                .returning(cls.id, cls.conv_id)
+            )
+            rows = result.fetchall()
+            db.session.commit()
+            if not rows:
+                return moved_count
+            ids = [id_ for id_, _ in rows]
+            cache.delete_many(
+                *(PrivateMessage.__cache_key__.format(id=id_) for id_ in ids)
+            )
+            versions.bump(
+                versions.conversation_key(conv_id)
+                for conv_id in {conv_id for _, conv_id in rows}
+            )
+            moved_count += len(ids)
 
     @cached_property
     def user(self):
         return User.from_pk(self.user_id)
+
+
+db.Index(
+    'ix_pm_messages_archive_conv_id_id',
+    PrivateMessageArchive.conv_id,
+    PrivateMessageArchive.id,
+)
+
+
+class PrivateMailboxCounts(db.Model, MultiPKMixin):
+    """
+    The number of conversations in each of a user's mailboxes. The counts are kept
+    up to date by the writes that move conversations between mailboxes, so reading
+    them never needs an aggregate query.
+    """
+
+    __tablename__ = 'pm_mailbox_counts'
+    __cache_key__ = 'pm_mailbox_counts_{user_id}'
+
+    user_id = db.Column(
+        db.Integer, db.ForeignKey('users.id'), primary_key=True
+    )
+    inbox = db.Column(db.Integer, nullable=False, server_default='0')
+    sentbox = db.Column(db.Integer, nullable=False, server_default='0')
+    deleted = db.Column(db.Integer, nullable=False, server_default='0')
+    unread = db.Column(db.Integer, nullable=False, server_default='0')
+
+    @classmethod
+    def from_user(cls, user_id: int) -> 'PrivateMailboxCounts':
+        """
+        Get the counts of a user, computing them the first time they are requested.
+        """
+        counts = cls.from_attrs(user_id=user_id)
+        if not counts:
+            user_ids = cls.recount([user_id])
+            db.session.commit()
+            cls.clear_cache_keys(user_ids)
+            counts = cls.from_attrs(user_id=user_id) or cls(
+                user_id=user_id, inbox=0, sentbox=0, deleted=0, unread=0
+            )
+        return counts
+
+    @classmethod
+    def recount(cls, user_ids: List[int] = None) -> List[int]:
+        """
+        Recompute the counts of the given users, or of every user, from their
+        conversation states. Given users without any states get a row of zeroes, so
+        that their counts are not recomputed on every read. This runs in the
+        caller's transaction; returns the IDs of the recounted users, whose cache
+        keys the caller clears after committing.
+        """
+        if user_ids is not None and not user_ids:
+            return []
+        db.session.flush()
+        state = PrivateConversationState
+        names = ['inbox', 'sentbox', 'deleted', 'unread']
+        in_inbox = and_(
+            state.deleted == 'f', state.last_response_time.isnot(None)
+        )
+        query = select(
+            [
+                state.user_id,
+                func.count().filter(in_inbox).label('inbox'),
+                func.count()
+                .filter(and_(state.deleted == 'f', state.in_sentbox == 't'))
+                .label('sentbox'),
+                func.count().filter(state.deleted == 't').label('deleted'),
+                func.count()
+                .filter(and_(in_inbox, state.read == 'f'))
+                .label('unread'),
+            ]
+        ).group_by(state.user_id)
+        if user_ids is not None:
+            query = query.where(state.user_id.in_(user_ids))
+            counts = query.alias('counts')
+            requested = select(
+                [
+                    func.unnest(
+                        array(list(dict.fromkeys(user_ids)), type_=db.Integer)
+                    ).label('user_id')
+                ]
+            ).alias('requested')
+            query = select(
+                [
+                    requested.c.user_id,
+                    *(
+                        func.coalesce(counts.c[name], 0).label(name)
+                        for name in names
+                    ),
+                ]
+            ).select_from(
+                requested.outerjoin(
+                    counts, counts.c.user_id == requested.c.user_id
+                )
+            )
+
+        stmt = insert(cls.__table__).from_select(['user_id', *names], query)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.user_id],
+            set_={c: getattr(stmt.excluded, c) for c in names},
+        )
+        result = db.session.execute(stmt.returning(cls.user_id))
+        return [user_id for user_id, in result]
+
+    @classmethod
+    def adjust(cls, user_id: int, **deltas: int) -> None:
+        """
+        Add to the counts of a user in the caller's transaction.
+        """
+        cls.adjust_many([user_id], **deltas)
+
+    @classmethod
+    def adjust_many(cls, user_ids: List[int], **deltas: int) -> None:
+        """
+        Add the same amounts to the counts of many users in the caller's transaction.
+        Users whose counts have not been computed yet are skipped, as their counts
+        will be computed from scratch when first read.
+        """
+        db.session.query(cls).filter(cls.user_id.in_(user_ids)).update(
+            {
+                getattr(cls, name): getattr(cls, name) + delta
+                for name, delta in deltas.items()
+            },
+            synchronize_session=False,
+        )
+
+    @classmethod
+    def count_message(cls, conv_id: int, sender_id: int) -> List[int]:
+        """
+        Count a new message in a conversation before its members' states are updated:
+        the conversation becomes unread for every other member, and enters the inbox
+        of those who have not received a response yet. Returns the IDs of the users
+        whose counts changed.
+        """
+        state = PrivateConversationState
+        counts = cls.__table__
+        result = db.session.execute(
+            counts.update()
+            .where(
+                and_(
+                    counts.c.user_id == state.user_id,
+                    state.conv_id == conv_id,
+                    state.user_id != sender_id,
+                    state.deleted == 'f',
+                    or_(
+                        state.last_response_time.is_(None),
+                        state.read == 't',
+                    ),
+                )
+            )
+            .values(
+                inbox=counts.c.inbox
+                + case([(state.last_response_time.is_(None), 1)], else_=0),
+                unread=counts.c.unread + 1,
+            )
+            .returning(counts.c.user_id)
+        )
+        return [user_id for user_id, in result]
+
+    @classmethod
+    def clear_cache_keys(cls, user_ids: List[int]) -> None:
+        if user_ids:
+            cache.delete_many(
+                *(
+                    cls.create_cache_key({'user_id': user_id})
+                    for user_id in user_ids
+                )
+            )
@@ -10,3 +10,4 @@ class MessagePermissions(PermissionsEnum):
     MODIFY = 'messages_modify'
     MULTI_USER = 'messages_add_multiple_users'
     ADD_TO_OTHERS = 'messages_add_to_others'
+    BROADCAST = 'messages_broadcast'
@@ -0,0 +1,32 @@
+from typing import List
+
+import flask
+from voluptuous import All, Length, Schema
+
+from core.utils import require_permission, validate_data
+from messages.models import PrivateConversation
+from messages.permissions import MessagePermissions
+
+from . import bp
+
+CREATE_BROADCAST_SCHEMA = Schema(
+    {
+        'topic': All(str, Length(min=1, max=128)),
+        'recipient_ids': All([int], Length(min=1)),
+        'message': str,
+    }
+)
+
+
+@bp.route('/messages/broadcasts', methods=['POST'])
+@require_permission(MessagePermissions.BROADCAST)
+@validate_data(CREATE_BROADCAST_SCHEMA)
+def create_broadcast(topic: str, recipient_ids: List[int], message: str):
+    return flask.jsonify(
+        PrivateConversation.broadcast(
+            topic=topic,
+            sender_id=flask.g.user.id,
+            recipient_ids=recipient_ids,
+            message=message,
+        )
+    )
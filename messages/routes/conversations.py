@@ -1,21 +1,38 @@
 from typing import List
 
 import flask
-from voluptuous import All, Coerce, In, Length, Range, Schema
+from voluptuous import All, Coerce, Exclusive, In, Length, Range, Schema
 
 from core import _403Exception, db
 from core.users.models import User
 from core.utils import access_other_user, require_permission, validate_data
-from messages.models import PrivateConversation, PrivateConversationState
+from messages import versions
+from messages.models import (
+    PrivateConversation,
+    PrivateConversationState,
+    PrivateMailboxCounts,
+)
 from messages.permissions import MessagePermissions
+from messages.serializers import serialize_many
 
 from . import bp
 
+
+def _not_modified(etag: str) -> bool:
+    return flask.request.if_none_match.contains_weak(etag)
+
+
+def _with_etag(response: flask.Response, etag: str) -> flask.Response:
+    response.set_etag(etag, weak=True)
+    return response
+
+
 VIEW_CONVERSATIONS_SCHEMA = Schema(
     {
         'page': All(Coerce(int), Range(min=0, max=2147483648)),
         'limit': All(Coerce(int), In((25, 50, 100))),
         'filter': All(str, In(('inbox', 'sentbox', 'deleted'))),
+        'cursor': str,
     }
 )
 
@@ -25,24 +42,50 @@ VIEW_CONVERSATIONS_SCHEMA = Schema(
 @access_other_user(MessagePermissions.VIEW_OTHERS)
 @validate_data(VIEW_CONVERSATIONS_SCHEMA)
 def view_conversations(
-    user: User, page: int = 1, limit: int = 50, filter: str = 'inbox'
+    user: User,
+    page: int = 1,
+    limit: int = 50,
+    filter: str = 'inbox',
+    cursor: str = None,
 ):
-    return flask.jsonify(
+    PrivateConversation.check_filter_permission(filter)
+    etag = versions.etag(user.id, *versions.get(versions.user_key(user.id)))
+    if _not_modified(etag):
+        return _with_etag(flask.Response(status=304), etag)
+    conversations = PrivateConversation.from_user(
+        user_id=user.id, page=page, limit=limit, filter=filter, cursor=cursor
+    )
+    response = flask.jsonify(
         {
             'conversations_count': PrivateConversation.count_from_user(
                 user.id, filter=filter
             ),
-            'conversations': PrivateConversation.from_user(
-                user_id=user.id, page=page, limit=limit, filter=filter
-            ),
+            'conversations': serialize_many(conversations, nested=False),
+            'next_cursor': conversations[-1].cursor
+            if len(conversations) == limit
+            else None,
         }
     )
+    return _with_etag(response, etag)
+
+
+@bp.route('/messages/unread_count', methods=['GET'])
+@require_permission(MessagePermissions.VIEW)
+@access_other_user(MessagePermissions.VIEW_OTHERS)
+def view_unread_count(user: User):
+    return flask.jsonify(PrivateMailboxCounts.from_user(user.id).unread)
 
 
 VIEW_CONVERSATION_SCHEMA = Schema(
     {
         'page': All(Coerce(int), Range(min=0, max=2147483648)),
         'limit': All(Coerce(int), In((25, 50, 100))),
+        Exclusive('after_id', 'cursor'): All(
+            Coerce(int), Range(min=0, max=2147483648)
+        ),
+        Exclusive('before_id', 'cursor'): All(
+            Coerce(int), Range(min=0, max=2147483648)
+        ),
     }
 )
 
@@ -50,15 +93,33 @@ VIEW_CONVERSATION_SCHEMA = Schema(
 @bp.route('/messages/conversations/<int:id>', methods=['GET'])
 @require_permission(MessagePermissions.VIEW)
 @validate_data(VIEW_CONVERSATION_SCHEMA)
-def view_conversation(id: int, page: int = 1, limit: int = 50):
+def view_conversation(
+    id: int,
+    page: int = 1,
+    limit: int = 50,
+    after_id: int = None,
+    before_id: int = None,
+):
     conv = PrivateConversation.from_pk(
         id, _404=True, asrt=MessagePermissions.VIEW_OTHERS
     )
+    keys = (versions.conversation_key(id), versions.user_key(flask.g.user.id))
+    etag = versions.etag(flask.g.user.id, *versions.get(*keys))
+    if _not_modified(etag):
+        return _with_etag(flask.Response(status=304), etag)
     conv.set_state(flask.g.user.id)
-    conv.set_messages(page, limit)
-    if page * limit > conv.messages_count:
+    conv.set_messages(page, limit, after_id=after_id, before_id=before_id)
+    if after_id is not None:
+        read_to_end = conv.messages_cursor is None
+    else:
+        read_to_end = before_id is None and page * limit > conv.messages_count
+    if read_to_end:
         conv.mark_read()
-    return flask.jsonify(conv)
+        # Marking the conversation read bumps the viewer's version.
+        etag = versions.etag(flask.g.user.id, *versions.get(*keys))
+    return _with_etag(
+        flask.jsonify(serialize_many([conv], nested=False)[0]), etag
+    )
 
 
 CREATE_CONVERSATION_SCHEMA = Schema(
@@ -105,29 +166,23 @@ def modify_conversations(
     read: bool = None,
     deleted: bool = None,
 ):
-    conversations = []
-    failed: List[str] = []
-    for conv_id in conversation_ids:
-        pm_state = PrivateConversationState.from_attrs(
-            conv_id=conv_id, user_id=user.id, deleted='f'
+    modified = set(
+        PrivateConversationState.modify_many(
+            user.id, conversation_ids, read=read, deleted=deleted
         )
-        if not pm_state:
-            failed.append(str(conv_id))
-        else:
-            conversations.append(pm_state)
+    )
+    failed = [str(c) for c in conversation_ids if c not in modified]
     if failed:
+        db.session.rollback()
         raise _403Exception(
             f'You cannot modify conversations that you are not a member of: {", ".join(failed)}.'
         )
-    for conv in conversations:
-        if read:
-            conv.read = read
-        if deleted:
-            conv.deleted = deleted
+    recounted_ids = PrivateMailboxCounts.recount([user.id])
     db.session.commit()
-    PrivateConversation.clear_cache_keys(user.id)
+    PrivateMailboxCounts.clear_cache_keys(recounted_ids)
+    PrivateConversationState.clear_cache_keys(user.id, list(modified))
     return flask.jsonify(
-        f'Successfully modified conversations {", ".join(str(c.conv_id) for c in conversations)}.'
+        f'Successfully modified conversations {", ".join(str(c) for c in conversation_ids)}.'
     )
 
 
@@ -141,17 +196,14 @@ MODIFY_CONVERSATION_SCHEMA = Schema({'read': bool, 'deleted': bool})
 def modify_conversation(
     user: User, id: int, read: bool = None, deleted: bool = None
 ):
-    pm_state = PrivateConversationState.from_attrs(
-        conv_id=id, user_id=user.id, deleted='f'
-    )
-    if not pm_state:
+    if not PrivateConversationState.modify_many(
+        user.id, [id], read=read, deleted=deleted
+    ):
         raise _403Exception(
             'You cannot modify a conversation that you are not a member of.'
         )
-    if read:
-        pm_state.read = read
-    if deleted:
-        pm_state.deleted = deleted
+    recounted_ids = PrivateMailboxCounts.recount([user.id])
     db.session.commit()
-    PrivateConversation.clear_cache_keys(user.id)
+    PrivateMailboxCounts.clear_cache_keys(recounted_ids)
+    PrivateConversationState.clear_cache_keys(user.id, [id])
     return flask.jsonify(f'Successfully modified conversation {id}.')
@@ -0,0 +1,24 @@
+import flask
+from voluptuous import All, Coerce, Range, Schema
+
+from core import db
+from core.utils import require_permission, validate_data
+from messages.events import get_broker
+from messages.permissions import MessagePermissions
+
+from . import bp
+
+VIEW_EVENTS_SCHEMA = Schema(
+    {'timeout': All(Coerce(int), Range(min=0, max=60))}
+)
+
+
+@bp.route('/messages/stream', methods=['GET'])
+@require_permission(MessagePermissions.VIEW)
+@validate_data(VIEW_EVENTS_SCHEMA)
+def view_events(timeout: int = 30):
+    user_id = flask.g.user.id
+    # Hand the connection back to the pool, as nothing else is read from the
+    # database while the client waits.
+    db.session.close()
+    return flask.jsonify(get_broker().wait(user_id, timeout))
@@ -0,0 +1,33 @@
+import flask
+from voluptuous import All, Coerce, In, Length, Required, Schema
+
+from core.users.models import User
+from core.utils import access_other_user, require_permission, validate_data
+from messages.models import PrivateMessage
+from messages.permissions import MessagePermissions
+
+from . import bp
+
+SEARCH_MESSAGES_SCHEMA = Schema(
+    {
+        Required('q'): All(str, Length(min=1, max=256)),
+        'limit': All(Coerce(int), In((25, 50, 100))),
+        'cursor': str,
+    }
+)
+
+
+@bp.route('/messages/search', methods=['GET'])
+@require_permission(MessagePermissions.VIEW)
+@access_other_user(MessagePermissions.VIEW_OTHERS)
+@validate_data(SEARCH_MESSAGES_SCHEMA)
+def search_messages(user: User, q: str, limit: int = 50, cursor: str = None):
+    messages = PrivateMessage.search(user.id, q, limit=limit, cursor=cursor)
+    return flask.jsonify(
+        {
+            'messages': messages,
+            'next_cursor': messages[-1].search_cursor
+            if len(messages) == limit
+            else None,
+        }
+    )
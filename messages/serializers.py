@@ -1,6 +1,13 @@
+import operator
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import flask
+
 from core.mixins import Attribute, Serializer
 from messages.permissions import MessagePermissions
 
+Plan = Tuple[Tuple[str, Callable[[Any], Any]], ...]
+
 
 class PrivateConversationSerializer(Serializer):
     id = Attribute(permission=MessagePermissions.VIEW_OTHERS)
@@ -8,9 +15,15 @@ class PrivateConversationSerializer(Serializer):
     last_response_time = Attribute(permission=MessagePermissions.VIEW_OTHERS)
     read = Attribute(permission=MessagePermissions.VIEW_OTHERS)
     sticky = Attribute(permission=MessagePermissions.VIEW_OTHERS)
+    last_message_id = Attribute(permission=MessagePermissions.VIEW_OTHERS)
+    last_sender_id = Attribute(permission=MessagePermissions.VIEW_OTHERS)
+    last_snippet = Attribute(permission=MessagePermissions.VIEW_OTHERS)
     messages = Attribute(
         nested=False, permission=MessagePermissions.VIEW_OTHERS
     )
+    messages_cursor = Attribute(
+        nested=False, permission=MessagePermissions.VIEW_OTHERS
+    )
     messages_count = Attribute(permission=MessagePermissions.VIEW_OTHERS)
     members = Attribute(permission=MessagePermissions.VIEW_OTHERS)
 
@@ -24,3 +37,113 @@ class PrivateMessageSerializer(Serializer):
     user = Attribute(nested=('id', 'username'))
     time = Attribute()
     contents = Attribute()
+
+
+_plans: Dict[Tuple[type, FrozenSet[Any], bool], Tuple[Plan, Plan]] = {}
+
+
+def _attributes(serializer: type) -> List[Tuple[str, Attribute]]:
+    return [
+        (name, attr)
+        for cls in reversed(serializer.__mro__)
+        for name, attr in vars(cls).items()
+        if isinstance(attr, Attribute)
+    ]
+
+
+def _getter(name: str, attr: Attribute) -> Callable[[Any], Any]:
+    get = operator.attrgetter(name)
+    fields = getattr(attr, 'nested', True)
+    if not isinstance(fields, tuple):
+        return get
+    pick = operator.attrgetter(*fields)
+
+    def get_nested(obj):
+        value = get(obj)
+        if value is None:
+            return None
+        values = pick(value)
+        return dict(zip(fields, values if len(fields) > 1 else (values,)))
+
+    return get_nested
+
+
+def compile_plan(
+    serializer: type, permissions: FrozenSet[Any], nested: bool
+) -> Tuple[Plan, Plan]:
+    """
+    Compile the attributes of a serializer into getters, once per viewer
+    permission set. Returns the plan for objects the viewer owns and the plan
+    for objects they do not.
+    """
+    key = (serializer, permissions, nested)
+    if key not in _plans:
+        owned, others = [], []
+        for name, attr in _attributes(serializer):
+            if nested and getattr(attr, 'nested', True) is False:
+                continue
+            field = (name, _getter(name, attr))
+            owned.append(field)
+            permission = getattr(attr, 'permission', None)
+            if permission is None or permission in permissions:
+                others.append(field)
+        _plans[key] = (tuple(owned), tuple(others))
+    return _plans[key]
+
+
+class _Serializer:
+    """
+    Serializes the models of one list, checking the viewer's permissions once
+    per serializer class rather than per attribute of every object.
+    """
+
+    def __init__(self) -> None:
+        self._permissions: Dict[type, FrozenSet[Any]] = {}
+
+    def permissions(self, serializer: type) -> FrozenSet[Any]:
+        if serializer not in self._permissions:
+            self._permissions[serializer] = frozenset(
+                perm
+                for perm in {
+                    getattr(attr, 'permission', None)
+                    for _, attr in _attributes(serializer)
+                }
+                if perm is not None and flask.g.user.has_permission(perm)
+            )
+        return self._permissions[serializer]
+
+    def model(self, obj: Any, nested: bool) -> Optional[Dict[str, Any]]:
+        serializer = obj.__serializer__
+        owned, others = compile_plan(
+            serializer, self.permissions(serializer), nested
+        )
+        plan = owned if owned == others or obj.belongs_to_user() else others
+        if not plan:
+            return None
+        return {name: self.value(get(obj)) for name, get in plan}
+
+    def value(self, value: Any) -> Any:
+        """
+        Serialize model values in their nested form, as the JSON encoder does
+        for models inside another model, and leave other values to the encoder.
+        """
+        if hasattr(value, '__serializer__'):
+            return self.model(value, nested=True)
+        if isinstance(value, list):
+            return [self.value(v) for v in value]
+        if isinstance(value, dict):
+            return {k: self.value(v) for k, v in value.items()}
+        return value
+
+
+def serialize_many(
+    objects: List[Any], nested: bool = True
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Serialize many models of one class into dictionaries with compiled plans,
+    checking the viewer's permissions once for the whole list rather than per
+    attribute of every object. Models held by the objects are serialized in
+    their nested form.
+    """
+    serializer = _Serializer()
+    return [serializer.model(obj, nested) for obj in objects]
@@ -0,0 +1,40 @@
+import time
+from typing import Any, Callable, Optional
+
+from core import cache
+
+LOCK_TIMEOUT = 10
+POLL_INTERVAL = 0.02
+
+
+def load(
+    key: str, compute: Callable[[], Any], timeout: Optional[int] = None
+) -> Any:
+    """
+    Get a value from the cache, computing and caching it on a miss. Only one
+    caller computes a missing value at a time, and the others wait for it to
+    finish. ``None`` results are not cached.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}_lock'
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        time.sleep(POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if time.monotonic() > deadline:
+            return compute()
+
+    try:
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                cache.set(key, value, timeout=timeout)
+    finally:
+        cache.delete(lock_key)
+    return value
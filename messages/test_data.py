@@ -1,7 +1,25 @@
+import csv
+import io
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Tuple
+
 from core import db
 from core.mixins import TestDataPopulator
+from messages.models import (
+    PrivateConversation,
+    PrivateMailboxCounts,
+    PrivateMessage,
+)
 from messages.permissions import MessagePermissions
 
+WORDS = (
+    'the a to and of in that is for it on with as was at by this be have '
+    'from or upload torrent seed ratio release tracker request thanks please '
+    'invite account forum thread album lossless format bitrate folder collage '
+    'artist'
+).split()
+
 
 class MessagesPopulator(TestDataPopulator):
     @classmethod
@@ -96,6 +114,34 @@ class MessagesPopulator(TestDataPopulator):
             (4, 2, 'testing', NOW())
             """
         )
+        db.session.execute(
+            """
+            UPDATE pm_conversations_state AS st SET in_sentbox = 't'
+            WHERE EXISTS (
+                SELECT 1 FROM pm_messages AS m
+                WHERE m.conv_id = st.conv_id AND m.user_id = st.user_id
+            )
+            """
+        )
+        db.session.execute(
+            """
+            UPDATE pm_conversations AS c
+            SET last_message_id = m.id, last_sender_id = m.user_id,
+                last_snippet = LEFT(m.contents, 140)
+            FROM (
+                SELECT DISTINCT ON (conv_id) id, conv_id, user_id, contents
+                FROM pm_messages ORDER BY conv_id, id DESC
+            ) AS m
+            WHERE m.conv_id = c.id
+            """
+        )
+        db.session.execute(
+            """
+            UPDATE pm_conversations AS c SET messages_count = (
+                SELECT COUNT(*) FROM pm_messages AS m WHERE m.conv_id = c.id
+            )
+            """
+        )
         cls.add_permissions(
             MessagePermissions.VIEW,
             MessagePermissions.CREATE,
@@ -106,6 +152,8 @@ class MessagesPopulator(TestDataPopulator):
 
     @classmethod
     def unpopulate(cls):
+        db.engine.execute('DELETE FROM pm_mailbox_counts')
+        db.engine.execute('DELETE FROM pm_messages_archive')
         db.engine.execute('DELETE FROM pm_messages')
         db.engine.execute('DELETE FROM pm_conversations_state')
         db.engine.execute('DELETE FROM pm_conversations')
@@ -113,3 +161,222 @@ class MessagesPopulator(TestDataPopulator):
             'ALTER SEQUENCE pm_conversations_id_seq RESTART WITH 1'
         )
         db.engine.execute('ALTER SEQUENCE pm_messages_id_seq RESTART WITH 1')
+
+
+Rows = Tuple[List[Any], List[List[Any]], List[List[Any]]]
+
+
+class SyntheticMessagesPopulator(MessagesPopulator):
+    """
+    Generate a large dataset of conversations between existing users, for
+    measuring how the plugin scales. Messages per conversation follow a Zipf
+    distribution, so a few conversations are very long and most are short. The
+    same parameters and seed always produce the same rows. The rows are bulk
+    loaded with COPY, a chunk of conversations at a time.
+    """
+
+    @classmethod
+    def populate(
+        cls,
+        users: int = 1000,
+        conversations: int = 100000,
+        messages: int = 1000000,
+        zipf_exponent: float = 1.1,
+        group_ratio: float = 0.1,
+        max_group_size: int = 10,
+        deleted_ratio: float = 0.05,
+        sticky_ratio: float = 0.01,
+        days: int = 365,
+        seed: int = 0,
+        chunk_size: int = 10000,
+    ) -> None:
+        user_ids = [
+            user_id
+            for user_id, in db.session.execute(
+                'SELECT id FROM users ORDER BY id LIMIT :limit',
+                {'limit': users},
+            )
+        ]
+        conv_start, message_start = db.session.execute(
+            """
+            SELECT
+                (SELECT COALESCE(MAX(id), 0) + 1 FROM pm_conversations),
+                (SELECT COALESCE(MAX(id), 0) + 1 FROM pm_messages)
+            """
+        ).fetchone()
+        rows = cls.generate(
+            random.Random(seed),
+            user_ids,
+            conversations=conversations,
+            messages=messages,
+            zipf_exponent=zipf_exponent,
+            group_ratio=group_ratio,
+            max_group_size=max_group_size,
+            deleted_ratio=deleted_ratio,
+            sticky_ratio=sticky_ratio,
+            now=datetime(2019, 1, 1, tzinfo=timezone.utc),
+            days=days,
+            conv_start=conv_start,
+            message_start=message_start,
+        )
+
+        cursor = db.session.connection().connection.cursor()
+        buffers: Dict[str, io.StringIO] = {}
+        for i, (conversation, states, conv_messages) in enumerate(rows, 1):
+            for table, table_rows in [
+                ('conversations', [conversation]),
+                ('states', states),
+                ('messages', conv_messages),
+            ]:
+                buffer = buffers.setdefault(table, io.StringIO())
+                csv.writer(buffer).writerows(table_rows)
+            if i % chunk_size == 0:
+                cls._copy(cursor, buffers)
+        cls._copy(cursor, buffers)
+
+        db.session.execute(
+            """
+            SELECT
+                setval('pm_conversations_id_seq', (
+                    SELECT MAX(id) FROM pm_conversations
+                )),
+                setval('pm_messages_id_seq', (SELECT MAX(id) FROM pm_messages))
+            """
+        )
+        recounted_ids = PrivateMailboxCounts.recount()
+        db.session.execute(
+            'ANALYZE pm_conversations, pm_conversations_state, pm_messages'
+        )
+        db.session.commit()
+        PrivateMailboxCounts.clear_cache_keys(recounted_ids)
+
+    @classmethod
+    def generate(
+        cls,
+        rng: random.Random,
+        user_ids: List[int],
+        conversations: int,
+        messages: int,
+        zipf_exponent: float,
+        group_ratio: float,
+        max_group_size: int,
+        deleted_ratio: float,
+        sticky_ratio: float,
+        now: datetime,
+        days: int,
+        conv_start: int = 1,
+        message_start: int = 1,
+    ) -> Iterator[Rows]:
+        """
+        Generate the rows of each conversation: the conversation, the states of
+        its members, and its messages, ready to be written as CSV.
+        """
+        weights = [
+            1 / rank ** zipf_exponent for rank in range(1, conversations + 1)
+        ]
+        total_weight = sum(weights)
+        rng.shuffle(weights)
+        message_id = message_start
+        for conv_id, weight in enumerate(weights, conv_start):
+            size = 2
+            if rng.random() < group_ratio:
+                size = rng.randint(3, max(3, max_group_size))
+            members = rng.sample(user_ids, min(size, len(user_ids)))
+            count = max(1, int(messages * weight / total_weight))
+
+            sent_at = now - timedelta(days=rng.uniform(0, days))
+            step = (now - sent_at) / (count + 1)
+            conv_messages = []
+            last_response = {}
+            for n in range(count):
+                sender_id = members[0] if n == 0 else rng.choice(members)
+                sent_at += step * rng.uniform(0.5, 1.5)
+                contents = cls.sentences(rng)
+                conv_messages.append(
+                    [
+                        message_id,
+                        conv_id,
+                        sender_id,
+                        sent_at.isoformat(),
+                        PrivateMessage.compress(contents),
+                    ]
+                )
+                for user_id in members:
+                    if user_id != sender_id:
+                        last_response[user_id] = sent_at
+                message_id += 1
+
+            senders = {row[2] for row in conv_messages}
+            states = [
+                [
+                    conv_id,
+                    user_id,
+                    cls._bool(i < 2),
+                    cls._bool(
+                        user_id not in last_response or rng.random() < 0.8
+                    ),
+                    cls._bool(rng.random() < sticky_ratio),
+                    cls._bool(rng.random() < deleted_ratio),
+                    last_response[user_id].isoformat()
+                    if user_id in last_response
+                    else None,
+                    cls._bool(user_id in senders),
+                ]
+                for i, user_id in enumerate(members)
+            ]
+            last = conv_messages[-1]
+            conversation = [
+                conv_id,
+                ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 6))),
+                members[0],
+                last[0],
+                last[2],
+                PrivateConversation.snippet(contents),
+                count,
+            ]
+            yield conversation, states, conv_messages
+
+    @staticmethod
+    def sentences(rng: random.Random) -> str:
+        return '\n'.join(
+            ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 20)))
+            for _ in range(rng.randint(1, 4))
+        )
+
+    @staticmethod
+    def _bool(value: bool) -> str:
+        return 't' if value else 'f'
+
+    @staticmethod
+    def _copy(cursor, buffers: Dict[str, io.StringIO]) -> None:
+        for table, columns in [
+            (
+                'conversations',
+                'pm_conversations (id, topic, sender_id, last_message_id, '
+                'last_sender_id, last_snippet, messages_count)',
+            ),
+            (
+                'states',
+                'pm_conversations_state (conv_id, user_id, original_member, '
+                'read, sticky, deleted, last_response_time, in_sentbox)',
+            ),
+            (
+                'messages',
+                'pm_messages (id, conv_id, user_id, time, contents)',
+            ),
+        ]:
+            buffer = buffers.pop(table, None)
+            if buffer is not None:
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY {columns} FROM STDIN WITH CSV', buffer
+                )
+
+    @classmethod
+    def unpopulate(cls):
+        db.engine.execute(
+            """
+            TRUNCATE pm_mailbox_counts, pm_messages_archive, pm_messages,
+                pm_conversations_state, pm_conversations RESTART IDENTITY
+            """
+        )
@@ -0,0 +1,98 @@
+import time
+from typing import Dict, Iterable, List
+
+import flask
+
+from core import cache
+
+USER_KEY = 'pm_version_user_{user_id}'
+CONVERSATION_KEY = 'pm_version_conv_{conv_id}'
+
+
+def user_key(user_id: int) -> str:
+    return USER_KEY.format(user_id=user_id)
+
+
+def conversation_key(conv_id: int) -> str:
+    return CONVERSATION_KEY.format(conv_id=conv_id)
+
+
+def _memo() -> Dict[str, int]:
+    """
+    The versions already read during the current request, so that repeat lookups
+    in one request do not go back to the cache.
+    """
+    if not flask.has_app_context():
+        return {}
+    return flask.g.setdefault('messages_versions', {})
+
+
+def get(*keys: str) -> List[int]:
+    """
+    Get the current versions of many scopes with a single cache read. A missing
+    version starts from the current time, so that a version is never reused after
+    its key is evicted.
+    """
+    memo = _memo()
+    missing = [key for key in keys if key not in memo]
+    if missing:
+        for key, version in zip(missing, cache.get_many(*missing)):
+            if version is None:
+                cache.add(key, time.time_ns())
+                version = cache.get(key)
+            memo[key] = version
+    return [memo[key] for key in keys]
+
+
+def of_user(user_id: int) -> int:
+    return get(user_key(user_id))[0]
+
+
+def of_conversation(conv_id: int) -> int:
+    return get(conversation_key(conv_id))[0]
+
+
+def _inc_many(keys: List[str]) -> List[int]:
+    """
+    Increment many cache keys, in one pipelined round trip when the cache is
+    backed by a Redis client.
+    """
+    client = getattr(cache, '_write_client', getattr(cache, '_client', None))
+    if not hasattr(client, 'pipeline'):
+        return [cache.inc(key) for key in keys]
+    prefix = getattr(cache, 'key_prefix', '') or ''
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.incr(prefix + key)
+    return pipe.execute()
+
+
+def bump(keys: Iterable[str]) -> None:
+    """
+    Increment the versions of many scopes. A version whose key was evicted is
+    restarted from the current time instead of from 1.
+    """
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return
+    memo = _memo()
+    for key in keys:
+        memo.pop(key, None)
+    now = time.time_ns()
+    restarted = {
+        key: now for key, version in zip(keys, _inc_many(keys)) if version == 1
+    }
+    if restarted:
+        cache.set_many(restarted)
+
+
+def bump_users(user_ids: Iterable[int]) -> None:
+    bump(user_key(user_id) for user_id in user_ids)
+
+
+def bump_conversation(conv_id: int, user_ids: Iterable[int] = ()) -> None:
+    bump([conversation_key(conv_id), *(user_key(u) for u in user_ids)])
+
+
+def etag(*versions: int) -> str:
+    return '-'.join(str(v) for v in versions)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Report the bytes saved and the CPU cost of compressing message contents, on a
+corpus of threads in which replies quote the messages before them.
+
+    python scripts/bench_compression.py [threshold] [threads]
+"""
+import random
+import sys
+import time
+
+from messages import compression
+from messages.test_data import SyntheticMessagesPopulator
+
+
+def make_corpus(threads=200, seed=0):
+    """
+    Build threads of replies. Most replies are short, and some quote the whole
+    previous reply, which is how long messages come about.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(threads):
+        previous = ''
+        for _ in range(rng.randint(1, 30)):
+            body = SyntheticMessagesPopulator.sentences(rng)
+            if previous and rng.random() < 0.4:
+                quoted = '\n'.join(f'> {line}' for line in previous.split('\n'))
+                body = f'{quoted}\n\n{body}'
+            corpus.append(body)
+            previous = body
+    return corpus
+
+
+def main():
+    threshold = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    corpus = make_corpus(int(sys.argv[2]) if len(sys.argv) > 2 else 200)
+
+    start = time.perf_counter()
+    stored = [compression.compress(text, threshold) for text in corpus]
+    compress_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for value in stored:
+        compression.decompress(value)
+    decompress_seconds = time.perf_counter() - start
+
+    raw_bytes = sum(len(text.encode()) for text in corpus)
+    stored_bytes = sum(len(value.encode()) for value in stored)
+    compressed = sum(value.startswith(compression.MARKER) for value in stored)
+    print(f'messages:     {len(corpus)} ({compressed} compressed)')
+    print(f'threshold:    {threshold} bytes')
+    print(f'raw:          {raw_bytes} bytes')
+    print(
+        f'stored:       {stored_bytes} bytes '
+        f'({100 * (1 - stored_bytes / raw_bytes):.1f}% saved)'
+    )
+    print(f'compress:     {1e6 * compress_seconds / len(corpus):.1f} us/message')
+    print(
+        f'decompress:   {1e6 * decompress_seconds / len(corpus):.1f} us/message'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Compare the core serializer with the compiled plans of ``serialize_many`` on a
+page of 100 conversations, without touching the database or the cache.
+
+    python scripts/bench_serializers.py [rounds]
+"""
+import sys
+import timeit
+from datetime import datetime
+
+import flask
+
+from core import NewJSONEncoder
+from core.users.models import User
+from messages.models import PrivateConversation
+from messages.serializers import serialize_many
+
+
+class Viewer:
+    id = 1
+
+    def has_permission(self, permission):
+        return False
+
+
+def make_page(size=100):
+    members = [
+        User(id=1, username='user_one'),
+        User(id=2, username='user_two'),
+    ]
+    page = []
+    for i in range(size):
+        conv = PrivateConversation(id=i, topic=f'Topic {i}', sender_id=1)
+        conv.read, conv.sticky = False, False
+        conv.last_response_time = datetime.utcnow()
+        conv.__dict__.update(members=members, messages_count=i)
+        conv._messages, conv._messages_cursor = [], None
+        page.append(conv)
+    return page
+
+
+def main(rounds):
+    with flask.Flask(__name__).app_context():
+        flask.g.user = Viewer()
+        page = make_page()
+        encoder = NewJSONEncoder()
+        core = timeit.timeit(
+            lambda: [encoder.default(c) for c in page], number=rounds
+        )
+        compiled = timeit.timeit(
+            lambda: serialize_many(page, nested=False), number=rounds
+        )
+    print(f'core serializer: {core / rounds * 1000:.3f} ms per page')
+    print(f'compiled plan:   {compiled / rounds * 1000:.3f} ms per page')
+    print(f'speedup:         {core / compiled:.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
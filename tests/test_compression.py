@@ -0,0 +1,99 @@
+import random
+import string
+from datetime import timedelta
+
+import pytest
+
+from core import db
+from messages import compression
+from messages.models import (
+    PrivateConversation,
+    PrivateMessage,
+    PrivateMessageArchive,
+    _cache_data,
+)
+
+QUOTED = '> ' + 'I think we should meet on Tuesday at the usual place.\n' * 40
+
+
+def test_compress_below_threshold():
+    assert compression.compress('hi', threshold=1024) == 'hi'
+    assert compression.compress(QUOTED, threshold=None) == QUOTED
+
+
+def test_compress_round_trip():
+    stored = compression.compress(QUOTED, threshold=1024)
+    assert stored.startswith(compression.MARKER)
+    assert len(stored) < len(QUOTED)
+    assert compression.decompress(stored) == QUOTED
+
+
+def test_compress_incompressible_stays_plain():
+    rng = random.Random(0)
+    text = ''.join(rng.choice(string.printable) for _ in range(1000))
+    assert compression.compress(text, threshold=16) == text
+
+
+def test_compress_escapes_marker():
+    text = compression.MARKER + 'hi'
+    stored = compression.compress(text)
+    assert stored != text
+    assert compression.decompress(stored) == text
+
+
+def test_decompress_existing_rows():
+    assert compression.decompress('boi') == 'boi'
+    for text in ['\x01hi there', '\x01', '\x01aGk=']:
+        assert compression.decompress(text) == text
+
+
+@pytest.fixture
+def compress_threshold(app):
+    app.config['MESSAGES_COMPRESS_THRESHOLD'] = 1024
+    yield
+    del app.config['MESSAGES_COMPRESS_THRESHOLD']
+
+
+def test_message_contents_compressed(client, compress_threshold):
+    message = PrivateMessage.new(conv_id=1, user_id=1, contents=QUOTED)
+    stored = db.session.execute(
+        'SELECT contents FROM pm_messages WHERE id = :id', {'id': message.id}
+    ).scalar()
+    assert stored.startswith(compression.MARKER)
+    db.session.expire_all()
+    assert PrivateMessage.from_pk(message.id).contents == QUOTED
+    assert PrivateMessage.from_pk(1).contents == 'boi'
+
+
+def test_broadcast_contents_compressed(client, compress_threshold):
+    PrivateConversation.broadcast(
+        topic='Announcement', sender_id=1, recipient_ids=[2], message=QUOTED
+    )
+    conv = PrivateConversation.from_pk(5)
+    stored = db.session.execute(
+        'SELECT contents FROM pm_messages WHERE conv_id = :id', {'id': conv.id}
+    ).scalar()
+    assert stored.startswith(compression.MARKER)
+    assert conv.messages[0].contents == QUOTED
+
+
+def test_archive_contents_compressed(client, compress_threshold):
+    message = PrivateMessage.new(conv_id=1, user_id=1, contents=QUOTED)
+    db.session.execute(
+        "UPDATE pm_messages SET time = NOW() - INTERVAL '30 DAYS' "
+        'WHERE id = :id',
+        {'id': message.id},
+    )
+    db.session.commit()
+    assert PrivateMessageArchive.archive(timedelta(days=7)) == 1
+    stored = db.session.execute(
+        'SELECT contents FROM pm_messages_archive WHERE id = :id',
+        {'id': message.id},
+    ).scalar()
+    assert stored.startswith(compression.MARKER)
+    assert PrivateMessage.from_history([message.id])[0].contents == QUOTED
+
+
+def test_cached_data_keeps_stored_form(client, compress_threshold):
+    message = PrivateMessage.new(conv_id=1, user_id=1, contents=QUOTED)
+    assert _cache_data(message)['_contents'].startswith(compression.MARKER)
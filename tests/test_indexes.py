@@ -0,0 +1,85 @@
+import pytest
+
+from core import db
+from messages.models import PrivateConversation, PrivateMessage
+
+
+@pytest.fixture(autouse=True)
+def seeded(client):
+    """
+    Seed enough rows for the planner statistics to be meaningful, and disable the
+    plans that would hide whether an index can serve a query on its own.
+    """
+    db.session.execute(
+        """
+        INSERT INTO pm_conversations (topic, sender_id)
+        SELECT 'seeded', 1 FROM generate_series(1, 2000)
+        """
+    )
+    db.session.execute(
+        """
+        INSERT INTO pm_conversations_state (
+            conv_id, user_id, original_member, sticky, deleted, in_sentbox,
+            last_response_time
+        )
+        SELECT id, 5, 't', id % 50 = 0, id % 10 = 0, id % 3 = 0,
+            NOW() - id * INTERVAL '1 MINUTE'
+        FROM pm_conversations WHERE topic = 'seeded'
+        """
+    )
+    db.session.execute(
+        """
+        INSERT INTO pm_messages (conv_id, user_id, contents)
+        SELECT 1, 1 + n % 2, 'seeded' FROM generate_series(1, 5000) AS n
+        """
+    )
+    db.session.execute('ANALYZE pm_conversations_state')
+    db.session.execute('ANALYZE pm_messages')
+    db.session.execute('SET LOCAL enable_seqscan = off')
+    db.session.execute('SET LOCAL enable_bitmapscan = off')
+    yield
+    db.session.rollback()
+
+
+def explain(query):
+    sql = getattr(query, 'statement', query).compile(
+        dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}
+    )
+    plan = db.session.execute(f'EXPLAIN (FORMAT JSON) {sql}').scalar()
+    nodes = [plan[0]['Plan']]
+    for node in nodes:
+        nodes.extend(node.get('Plans', []))
+    return nodes
+
+
+def assert_served_by(nodes, index):
+    assert any(n.get('Index Name') == index for n in nodes)
+    assert not any(n['Node Type'] == 'Sort' for n in nodes)
+
+
+def test_inbox_uses_inbox_index():
+    nodes = explain(PrivateConversation.mailbox_query(5, 'inbox').limit(50))
+    assert_served_by(nodes, 'ix_pm_conversations_state_inbox')
+
+
+def test_sentbox_uses_sentbox_index():
+    nodes = explain(PrivateConversation.mailbox_query(5, 'sentbox').limit(50))
+    assert_served_by(nodes, 'ix_pm_conversations_state_sentbox')
+
+
+def test_message_page_uses_conv_id_id_indexes():
+    for stmt in [
+        PrivateMessage.history_ids(1, after_id=4000),
+        PrivateMessage.history_ids(1, before_id=1000),
+    ]:
+        nodes = explain(stmt.limit(50))
+        assert_served_by(nodes, 'ix_pm_messages_conv_id_id')
+        assert_served_by(nodes, 'ix_pm_messages_archive_conv_id_id')
+
+
+def test_search_uses_search_index():
+    db.session.execute('SET LOCAL enable_bitmapscan = on')
+    nodes = explain(PrivateMessage.search_query(1, 'seeded').limit(50))
+    assert any(
+        n.get('Index Name') == 'ix_pm_messages_contents_search' for n in nodes
+    )
@@ -0,0 +1,53 @@
+import pytest
+
+from messages.local_cache import LocalCache
+from messages.models import (
+    PrivateConversation,
+    PrivateConversationState,
+    PrivateMessage,
+)
+
+
+@pytest.fixture
+def local_cache(app):
+    app.extensions['messages_local_cache'] = LocalCache(maxsize=128, ttl=60)
+    yield app.extensions['messages_local_cache']
+    del app.extensions['messages_local_cache']
+
+
+def test_local_cache_evicts_least_recently_used():
+    local = LocalCache(maxsize=2)
+    local.set('a', 1)
+    local.set('b', 2)
+    assert local.get('a') == 1
+    local.set('c', 3)
+    assert local.get('b') is None
+    assert local.get('a') == 1
+    assert local.get('c') == 3
+    assert local.stats == {'hits': 3, 'misses': 1, 'evictions': 1, 'size': 2}
+
+
+def test_local_cache_expires_entries():
+    local = LocalCache(ttl=-1)
+    local.set('a', 1)
+    assert local.get('a') is None
+    assert local.stats['size'] == 0
+
+
+def test_members_served_from_local_cache(client, local_cache):
+    user_ids = PrivateConversationState.get_user_ids_in_conversation(1)
+    assert set(user_ids) == {1, 2, 3}
+    hits = local_cache.hits
+    assert PrivateConversationState.get_user_ids_in_conversation(1) == user_ids
+    assert local_cache.hits == hits + 1
+
+
+def test_local_cache_follows_versions(client, local_cache):
+    conv = PrivateConversation.from_pk(2)
+    conv.set_state(1)
+    assert conv.messages_count == 2
+    PrivateMessage.new(conv_id=2, user_id=2, contents='hi')
+    conv = PrivateConversation.from_pk(2)
+    conv.set_state(1)
+    assert conv.messages_count == 3
+    assert conv.read is False
@@ -1,17 +1,23 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from unittest import mock
 
 import pytest
 import pytz
 
 from conftest import add_permissions, check_dictionary
-from core import NewJSONEncoder, _403Exception, cache
+from core import APIException, NewJSONEncoder, _403Exception, cache, db
+from core.users.models import User
+from messages import versions
 from messages.exceptions import PMStateNotFound
 from messages.models import (
     PrivateConversation,
     PrivateConversationState,
+    PrivateMailboxCounts,
     PrivateMessage,
+    PrivateMessageArchive,
 )
 from messages.permissions import MessagePermissions
+from messages.serializers import compile_plan, serialize_many
 
 
 def test_get_conversation(client):
@@ -42,6 +48,86 @@ def test_create_new_conversation_and_messages_from_conversation(client):
     assert len(pm_messages) == 1
     assert pm_messages[0].contents == 'testing'
     assert pm_messages[0].user_id == 3
+    assert pm.last_message_id == pm_messages[0].id
+    assert pm.last_sender_id == 3
+    assert pm.last_snippet == 'testing'
+    assert pm.messages_count == 1
+
+
+def test_make_message_sets_last_message(client):
+    PrivateConversation.from_pk(2)
+    message = PrivateMessage.new(
+        conv_id=2, user_id=2, contents='  hello   there\nfriend ' + 'x' * 200
+    )
+    conv = PrivateConversation.from_pk(2)
+    assert conv.last_message_id == message.id
+    assert conv.last_sender_id == 2
+    assert conv.last_snippet.startswith('hello there friend xx')
+    assert len(conv.last_snippet) == 140
+
+
+def test_recount_messages(client):
+    db.session.execute('UPDATE pm_conversations SET messages_count = 0')
+    db.session.commit()
+    PrivateConversation.from_pk(2)
+    changed = PrivateConversation.recount_messages()
+    db.session.commit()
+    counts = dict(
+        db.session.execute('SELECT id, messages_count FROM pm_conversations')
+    )
+    assert counts == {1: 54, 2: 2, 3: 1, 4: 1}
+    assert sorted(changed) == [1, 2, 3, 4]
+    user_version = versions.of_user(1)
+    PrivateConversation.clear_conversation_cache_keys(changed)
+    assert not cache.has(PrivateConversation.__cache_key__.format(id=2))
+    assert versions.of_user(1) > user_version
+    assert PrivateConversation.recount_messages() == []
+
+
+def test_refresh_last_messages(client):
+    message = PrivateMessage.new(conv_id=2, user_id=2, contents='hello')
+    db.session.execute(
+        'UPDATE pm_conversations SET last_message_id = NULL, '
+        'last_sender_id = NULL, last_snippet = NULL'
+    )
+    assert 2 in PrivateConversation.refresh_last_messages()
+    assert PrivateConversation.refresh_last_messages() == []
+    db.session.commit()
+    db.session.expire_all()
+    row = db.session.execute(
+        'SELECT last_message_id, last_sender_id, last_snippet '
+        'FROM pm_conversations WHERE id = 2'
+    ).fetchone()
+    assert tuple(row) == (message.id, 2, 'hello')
+
+
+def test_create_new_conversation_states(client):
+    PrivateMailboxCounts.from_user(2)
+    pm = PrivateConversation.new(
+        topic='test1',
+        sender_id=3,
+        recipient_ids=[2, 2, 3],
+        initial_message='testing',
+    )
+    pm.set_state(3)
+    assert (pm.read, pm.last_response_time) == (True, None)
+    pm.set_state(2)
+    assert pm.read is False
+    assert pm.last_response_time is not None
+    assert {m.id for m in pm.members} == {2, 3}
+    assert PrivateMailboxCounts.from_user(2).inbox == 4
+    assert pm.id in {c.id for c in PrivateConversation.from_user(2)}
+
+
+def test_create_new_conversation_invalid_recipient(client):
+    with pytest.raises(APIException):
+        PrivateConversation.new(
+            topic='test1',
+            sender_id=3,
+            recipient_ids=[2, 999],
+            initial_message='testing',
+        )
+    assert not PrivateConversation.from_pk(5)
 
 
 def test_make_message(client):
@@ -55,11 +141,38 @@ def test_make_message(client):
     PrivateMessage.new(conv_id=1, user_id=2, contents='hi')
     assert not cache.has(pm_state.cache_key)
     pm.set_state(1)
+    assert pm.read is False
     assert (
         datetime.utcnow().replace(tzinfo=pytz.utc) - pm.last_response_time
     ).total_seconds() < 15
 
 
+def test_make_message_clears_member_keys(client):
+    PrivateConversation.from_user(3)
+    key = PrivateConversation.__cache_key_of_user__.format(
+        user_id=3, filter='inbox', version=versions.of_user(3)
+    )
+    assert cache.has(key)
+    message = PrivateMessage.new(conv_id=2, user_id=1, contents='hi')
+    assert message.id == 59
+    assert not cache.has(
+        PrivateConversation.__cache_key_of_user__.format(
+            user_id=3, filter='inbox', version=versions.of_user(3)
+        )
+    )
+    assert 2 in {c.id for c in PrivateConversation.from_user(3)}
+
+
+def test_make_message_clears_conversation_keys(client):
+    conv = PrivateConversation.from_pk(2)
+    assert conv.messages_count == 2
+    assert len(PrivateMessage.from_conversation(2)) == 2
+    PrivateMessage.new(conv_id=2, user_id=1, contents='hi')
+    conv = PrivateConversation.from_pk(2)
+    assert conv.messages_count == 3
+    assert len(PrivateMessage.from_conversation(2)) == 3
+
+
 def test_conversation_from_user_inbox(client):
     convs = PrivateConversation.from_user(1)
     assert len(convs) == 2
@@ -68,8 +181,8 @@ def test_conversation_from_user_inbox(client):
 
 def test_conversation_from_user_sentbox(client):
     convs = PrivateConversation.from_user(1, filter='sentbox')
-    assert len(convs) == 3
-    assert all(c.id in {1, 2, 3} for c in convs)
+    assert len(convs) == 2
+    assert all(c.id in {1, 3} for c in convs)
 
 
 def test_conversation_from_user_deletebox(app, authed_client):
@@ -106,6 +219,18 @@ def test_conversation_set_state_nonexistent(client):
         pm.set_state(5)
 
 
+def test_state_from_conversation_bad_cache_shape(client):
+    key = PrivateConversationState.create_cache_key(
+        {'conv_id': 2, 'user_id': 1}
+    )
+    cache.set(key, {'conv_id': 2})
+    state = PrivateConversationState.from_conversation(2, 1)
+    assert state.conv_id == 2 and state.user_id == 1
+    assert set(cache.get(key)) == set(
+        PrivateConversationState.__table__.columns.keys()
+    )
+
+
 def test_belongs_to_user(authed_client):
     assert PrivateConversation.from_pk(1).belongs_to_user()
     assert PrivateConversation.from_pk(2).belongs_to_user()
@@ -133,20 +258,22 @@ def test_clear_cache_keys(client):
         for f in ['inbox', 'sentbox', 'deleted']:
             cache.set(
                 PrivateConversation.__cache_key_of_user__.format(
-                    user_id=uid, filter=f
+                    user_id=uid, filter=f, version=versions.of_user(uid)
                 ),
                 1,
             )
+    user_two_version = versions.of_user(2)
     PrivateConversation.clear_cache_keys(1)
+    assert versions.of_user(2) == user_two_version
     for f in ['inbox', 'sentbox', 'deleted']:
         assert not cache.has(
             PrivateConversation.__cache_key_of_user__.format(
-                user_id=1, filter=f
+                user_id=1, filter=f, version=versions.of_user(1)
             )
         )
         assert cache.has(
             PrivateConversation.__cache_key_of_user__.format(
-                user_id=2, filter=f
+                user_id=2, filter=f, version=user_two_version
             )
         )
 
@@ -164,9 +291,191 @@ def test_serialize_view_fail(authed_client):
     assert data is None
 
 
+def test_serialize_many(authed_client):
+    pm = PrivateConversation.from_pk(1)
+    pm.set_state(1)
+    data = serialize_many([pm], nested=False)[0]
+    assert data == NewJSONEncoder().default(pm)
+    assert all(isinstance(member, dict) for member in data['members'])
+    check_dictionary(data, {'id': 1, 'topic': 'New Private Message!'})
+    data = serialize_many([pm])[0]
+    assert 'messages' not in data
+    assert data['messages_count'] == 54
+
+
+def test_serialize_many_view_fail(authed_client):
+    assert serialize_many([PrivateConversation.from_pk(4)]) == [None]
+
+
+def test_compile_plan_cached(authed_client):
+    plan = compile_plan(PrivateConversation.__serializer__, frozenset(), True)
+    assert plan is compile_plan(
+        PrivateConversation.__serializer__, frozenset(), True
+    )
+    assert plan[1] == ()
+
+
 def test_serialize_view_others(app, authed_client):
     add_permissions(app, MessagePermissions.VIEW_OTHERS)
     pm = PrivateConversation.from_pk(4)
     pm.set_state(2)
     data = NewJSONEncoder().default(pm)
     check_dictionary(data, {'id': 4, 'topic': 'detingstings'})
+
+
+def test_conversation_from_user_sets_states(client):
+    convs = PrivateConversation.from_user(1)
+    states = {c.id: (c.read, c.sticky) for c in convs}
+    assert states == {1: (False, False), 2: (True, True)}
+
+
+def test_state_from_conversations(client):
+    states = PrivateConversationState.from_conversations([1, 2, 4], 1)
+    assert set(states) == {1, 2}
+    assert all(s.user_id == 1 for s in states.values())
+    assert cache.has(states[1].cache_key)
+    states = PrivateConversationState.from_conversations([1, 2, 4], 1)
+    assert set(states) == {1, 2}
+    assert states[2].sticky is True
+
+
+def test_state_from_conversations_caches_misses_at_once(client):
+    with mock.patch.object(
+        cache, 'set_many', wraps=cache.set_many
+    ) as set_many:
+        states = PrivateConversationState.from_conversations([1, 2, 3], 1)
+    assert set(states) == {1, 2, 3}
+    set_many.assert_called_once()
+    assert len(set_many.call_args[0][0]) == 3
+
+
+def test_messages_from_conversation_after_id(client):
+    pm_messages = PrivateMessage.from_conversation(1, limit=25, after_id=50)
+    assert [m.id for m in pm_messages] == [51, 52, 53, 54]
+
+
+def test_messages_from_conversation_before_id(client):
+    pm_messages = PrivateMessage.from_conversation(1, limit=2, before_id=5)
+    assert [m.id for m in pm_messages] == [3, 4]
+
+
+def test_archive_messages(client):
+    PrivateMessage.from_conversation(1)
+    version = versions.of_conversation(1)
+    moved = PrivateMessageArchive.archive(
+        timedelta(days=2, hours=12), chunk_size=1
+    )
+    assert moved == 1
+    assert versions.of_conversation(1) > version
+    assert PrivateMessage.from_pk(1) is None
+    pm_messages = PrivateMessage.from_conversation(1, limit=2)
+    assert [m.id for m in pm_messages] == [1, 2]
+    assert isinstance(pm_messages[0], PrivateMessageArchive)
+    assert pm_messages[0].contents == 'boi'
+    pm_messages = PrivateMessage.from_conversation(1, limit=2, before_id=3)
+    assert [m.id for m in pm_messages] == [1, 2]
+    assert PrivateConversation.from_pk(1).messages_count == 54
+
+
+def test_set_messages_cursor(client):
+    pm = PrivateConversation.from_pk(1)
+    pm.set_messages(limit=25, after_id=25)
+    assert pm.messages_cursor == 50
+    pm.set_messages(limit=25, after_id=50)
+    assert len(pm.messages) == 4
+    assert pm.messages_cursor is None
+
+
+def test_conversation_from_user_ordering(client):
+    assert [c.id for c in PrivateConversation.from_user(1)] == [2, 1]
+    assert [c.id for c in PrivateConversation.from_user(2)] == [3, 2, 1]
+
+
+def test_conversation_from_user_cursor(client):
+    convs = PrivateConversation.from_user(2, limit=1)
+    assert [c.id for c in convs] == [3]
+    convs = PrivateConversation.from_user(2, limit=1, cursor=convs[0].cursor)
+    assert [c.id for c in convs] == [2]
+    convs = PrivateConversation.from_user(2, cursor=convs[0].cursor)
+    assert [c.id for c in convs] == [1]
+
+
+def test_conversation_from_user_cursor_nulls_last(client):
+    convs = PrivateConversation.from_user(2, filter='sentbox')
+    assert convs[-1].id == 4
+    cursor = next(c.cursor for c in convs if c.id == 1)
+    convs = PrivateConversation.from_user(2, filter='sentbox', cursor=cursor)
+    assert [c.id for c in convs] == [4]
+
+
+def test_mailbox_counts(client):
+    counts = PrivateMailboxCounts.from_user(1)
+    assert (counts.inbox, counts.sentbox, counts.deleted, counts.unread) == (
+        2,
+        2,
+        0,
+        1,
+    )
+
+
+def test_mailbox_counts_new_message(client):
+    PrivateMailboxCounts.from_user(1)
+    PrivateMailboxCounts.from_user(3)
+    PrivateMessage.new(conv_id=2, user_id=1, contents='hi')
+    counts = PrivateMailboxCounts.from_user(1)
+    assert (counts.inbox, counts.sentbox, counts.unread) == (2, 3, 1)
+    counts = PrivateMailboxCounts.from_user(3)
+    assert (counts.inbox, counts.unread) == (3, 3)
+
+
+def test_mailbox_counts_recount(client):
+    PrivateMailboxCounts.from_user(1).inbox = 100
+    db.session.commit()
+    user_ids = PrivateMailboxCounts.recount([1])
+    db.session.commit()
+    assert user_ids == [1]
+    PrivateMailboxCounts.clear_cache_keys(user_ids)
+    assert PrivateMailboxCounts.from_user(1).inbox == 2
+
+
+def test_mailbox_counts_recount_without_states(client):
+    db.session.execute('DELETE FROM pm_conversations_state WHERE user_id = 1')
+    db.session.commit()
+    assert PrivateMailboxCounts.recount([1, 1]) == [1]
+    db.session.commit()
+    row = db.session.execute(
+        'SELECT inbox, sentbox, deleted, unread FROM pm_mailbox_counts '
+        'WHERE user_id = 1'
+    ).fetchone()
+    assert tuple(row) == (0, 0, 0, 0)
+    assert PrivateMailboxCounts.recount([]) == []
+
+
+def test_new_message_adds_to_sentbox(client):
+    assert not PrivateConversationState.from_attrs(
+        conv_id=2, user_id=1
+    ).in_sentbox
+    PrivateMessage.new(conv_id=2, user_id=1, contents='hi')
+    assert PrivateConversationState.from_attrs(
+        conv_id=2, user_id=1
+    ).in_sentbox
+    convs = PrivateConversation.from_user(1, filter='sentbox')
+    assert {c.id for c in convs} == {1, 2, 3}
+
+
+def test_modify_many_states(client):
+    PrivateConversationState.from_attrs(conv_id=3, user_id=3)
+    modified = PrivateConversationState.modify_many(
+        3, [1, 2, 3, 4, 5], deleted=True
+    )
+    db.session.commit()
+    PrivateConversationState.clear_cache_keys(3, modified)
+    assert set(modified) == {1, 2, 4}
+    assert PrivateConversationState.from_attrs(conv_id=1, user_id=3).deleted
+
+
+def test_messages_from_conversation_prefetch_users(client):
+    pm_messages = PrivateMessage.from_conversation(2)
+    with mock.patch.object(User, 'from_pk') as from_pk:
+        assert all(m.user.id == 3 for m in pm_messages)
+        from_pk.assert_not_called()
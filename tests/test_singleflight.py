@@ -0,0 +1,79 @@
+import threading
+import time
+
+from sqlalchemy import event
+
+from core import cache, db
+from messages import singleflight, versions
+from messages.models import PrivateConversationState
+
+
+def _load_concurrently(app, key, compute, threads=20, **kwargs):
+    barrier = threading.Barrier(threads)
+    results = []
+
+    def worker():
+        with app.app_context():
+            barrier.wait()
+            results.append(singleflight.load(key, compute, **kwargs))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return results
+
+
+def test_load_cold_key_computes_once(app):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return [1, 2, 3]
+
+    cache.delete('pm_singleflight_test')
+    results = _load_concurrently(app, 'pm_singleflight_test', compute)
+    assert len(calls) == 1
+    assert results == [[1, 2, 3]] * 20
+    assert cache.get('pm_singleflight_test') == [1, 2, 3]
+
+
+def test_member_ids_cold_key_loaded_once(app, client):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if 'FROM pm_conversations_state' in statement:
+            statements.append(statement)
+
+    versions.bump_conversation(2)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        barrier = threading.Barrier(20)
+        results = []
+
+        def worker():
+            with app.app_context():
+                barrier.wait()
+                results.append(
+                    PrivateConversationState.get_user_ids_in_conversation(2)
+                )
+
+        workers = [threading.Thread(target=worker) for _ in range(20)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert len(statements) == 1
+    assert len(results) == 20
+    assert all(set(r) == {1, 2, 3} for r in results)
+
+
+def test_load_does_not_cache_none(app):
+    cache.delete('pm_singleflight_test')
+    assert singleflight.load('pm_singleflight_test', lambda: None) is None
+    assert not cache.has('pm_singleflight_test')
+    assert not cache.has('pm_singleflight_test_lock')
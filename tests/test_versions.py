@@ -0,0 +1,24 @@
+from core import cache
+from messages import versions
+
+
+def test_bump_increments_many(app):
+    keys = [versions.user_key(1), versions.user_key(2)]
+    before = versions.get(*keys)
+    versions.bump(keys)
+    assert versions.get(*keys) == [v + 1 for v in before]
+
+
+def test_bump_restarts_evicted_version(app):
+    key = versions.user_key(1)
+    old = versions.of_user(1)
+    cache.delete(key)
+    versions.bump([key])
+    assert versions.of_user(1) > old
+
+
+def test_bump_duplicate_keys_once(app):
+    key = versions.conversation_key(1)
+    before = versions.of_conversation(1)
+    versions.bump([key, key])
+    assert versions.of_conversation(1) == before + 1
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from conftest import add_permissions
+from core import db
+from messages.models import PrivateConversation, PrivateMailboxCounts
+from messages.permissions import MessagePermissions
+
+
+def test_broadcast(client):
+    PrivateMailboxCounts.from_user(2)
+    result = PrivateConversation.broadcast(
+        topic='Announcement',
+        sender_id=1,
+        recipient_ids=[2, 3, 4, 1, 2],
+        message='hello all',
+        chunk_size=2,
+    )
+    assert result['conversations'] == 3
+    convs = PrivateConversation.from_user(4)
+    assert len(convs) == 1
+    assert convs[0].topic == 'Announcement'
+    assert convs[0].read is False
+    assert convs[0].messages[0].contents == 'hello all'
+    assert convs[0].last_message_id == convs[0].messages[0].id
+    assert convs[0].last_snippet == 'hello all'
+    assert convs[0].messages_count == 1
+    assert {m.id for m in convs[0].members} == {1, 4}
+    assert PrivateMailboxCounts.from_user(2).unread == 4
+
+
+def test_create_broadcast(app, authed_client):
+    add_permissions(app, MessagePermissions.BROADCAST)
+    response = authed_client.post(
+        '/messages/broadcasts',
+        data=json.dumps(
+            {'topic': 'Hi', 'recipient_ids': [2, 3], 'message': 'hello'}
+        ),
+    ).get_json()['response']
+    assert response['conversations'] == 2
+    sentbox = PrivateConversation.from_user(1, filter='sentbox')
+    assert sum(c.topic == 'Hi' for c in sentbox) == 2
+
+
+def test_create_broadcast_invalid_recipients(app, authed_client):
+    add_permissions(app, MessagePermissions.BROADCAST)
+    response = authed_client.post(
+        '/messages/broadcasts',
+        data=json.dumps(
+            {'topic': 'Hi', 'recipient_ids': [2, 999], 'message': 'hello'}
+        ),
+    ).get_json()['response']
+    assert response == 'The following user_ids are invalid: 999.'
+
+
+@pytest.mark.parametrize('endpoint, method', [('/messages/broadcasts', 'POST')])
+def test_route_permissions(app, authed_client, endpoint, method):
+    db.engine.execute('DELETE FROM users_permissions')
+    response = authed_client.open(endpoint, method=method).get_json()[
+        'response'
+    ]
+    assert response == 'You do not have permission to access this resource.'
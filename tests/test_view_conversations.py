@@ -1,10 +1,16 @@
 import json
 
 import pytest
+from sqlalchemy import event
 
 from conftest import add_permissions
 from core import db
-from messages.models import PrivateConversation, PrivateConversationState
+from messages.models import (
+    PrivateConversation,
+    PrivateConversationState,
+    PrivateMailboxCounts,
+    PrivateMessage,
+)
 from messages.permissions import MessagePermissions
 
 
@@ -13,6 +19,10 @@ def test_view_conversations(app, authed_client):
     response = response['response']
     assert len(response['conversations']) == 2
     assert all(c['id'] in {1, 2} for c in response['conversations'])
+    conv = next(c for c in response['conversations'] if c['id'] == 2)
+    assert conv['last_message_id'] == 56
+    assert conv['last_sender_id'] is not None
+    assert conv['last_snippet']
 
 
 def test_view_conversations_paginated_page(app, authed_client):
@@ -24,13 +34,29 @@ def test_view_conversations_paginated_page(app, authed_client):
     assert response['conversations_count'] == 2
 
 
+def test_view_conversations_cursor(app, authed_client):
+    response = authed_client.get(
+        '/messages/conversations', query_string={'limit': 25}
+    ).get_json()['response']
+    assert [c['id'] for c in response['conversations']] == [2, 1]
+    assert response['next_cursor'] is None
+
+
+def test_view_conversations_invalid_cursor(app, authed_client):
+    response = authed_client.get(
+        '/messages/conversations', query_string={'cursor': 'notacursor'}
+    ).get_json()['response']
+    assert response == 'Invalid cursor.'
+
+
 def test_view_sentbox(app, authed_client):
     response = authed_client.get(
         '/messages/conversations', query_string={'filter': 'sentbox'}
     ).get_json()
     response = response['response']
-    assert len(response['conversations']) == 3
-    assert all(c['id'] in {1, 2, 3} for c in response['conversations'])
+    assert len(response['conversations']) == 2
+    assert response['conversations_count'] == 2
+    assert all(c['id'] in {1, 3} for c in response['conversations'])
 
 
 def test_view_conversations_others(app, authed_client):
@@ -50,6 +76,44 @@ def test_view_conversations_others_perm_fail(app, authed_client):
     assert response.status_code == 403
 
 
+def test_view_unread_count(app, authed_client):
+    response = authed_client.get('/messages/unread_count').get_json()
+    assert response['response'] == 1
+
+
+def test_view_unread_count_without_states(app, authed_client):
+    db.session.execute('DELETE FROM pm_conversations_state WHERE user_id = 1')
+    db.session.commit()
+    response = authed_client.get('/messages/unread_count').get_json()
+    assert response['response'] == 0
+    PrivateMailboxCounts.clear_cache_keys([1])
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        for _ in range(2):
+            response = authed_client.get('/messages/unread_count').get_json()
+            assert response['response'] == 0
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert not any('pm_conversations_state' in s for s in statements)
+
+
+def test_unread_count_reply_and_mark_read(app, authed_client):
+    PrivateMessage.new(conv_id=2, user_id=2, contents='hi')
+    response = authed_client.get('/messages/unread_count').get_json()
+    assert response['response'] == 2
+    authed_client.put(
+        '/messages/conversations/2', data=json.dumps({'read': True})
+    )
+    response = authed_client.get('/messages/unread_count').get_json()
+    assert response['response'] == 1
+
+
 def test_view_conversation(app, authed_client):
     assert (
         PrivateConversationState.from_attrs(conv_id=1, user_id=1).read is False
@@ -76,6 +140,19 @@ def test_view_conversation_pagination(app, authed_client):
     )
 
 
+def test_view_conversation_cursor(app, authed_client):
+    response = authed_client.get('/messages/conversations/1')
+    json = response.get_json()['response']
+    assert json['messages_cursor'] == 50
+    response = authed_client.get(
+        '/messages/conversations/1', query_string={'after_id': 50}
+    )
+    json = response.get_json()['response']
+    assert [m['id'] for m in json['messages']] == [51, 52, 53, 54]
+    assert json['messages_cursor'] is None
+    assert json['read'] is True
+
+
 def test_view_conversation_deleted(app, authed_client):
     PrivateConversationState.from_attrs(conv_id=1, user_id=1).deleted = True
     db.session.commit()
@@ -85,6 +162,71 @@ def test_view_conversation_deleted(app, authed_client):
     assert response == 'PrivateConversation 1 does not exist.'
 
 
+def test_view_conversations_etag(app, authed_client):
+    response = authed_client.get('/messages/conversations')
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    response = authed_client.get(
+        '/messages/conversations', headers={'If-None-Match': etag}
+    )
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_view_conversations_etag_deleted_no_perm(app, authed_client):
+    etag = authed_client.get('/messages/conversations').headers['ETag']
+    response = authed_client.get(
+        '/messages/conversations',
+        query_string={'filter': 'deleted'},
+        headers={'If-None-Match': etag},
+    )
+    assert response.status_code == 403
+
+
+def test_view_conversations_etag_changes_on_reply(app, authed_client):
+    etag = authed_client.get('/messages/conversations').headers['ETag']
+    PrivateMessage.new(conv_id=2, user_id=2, contents='hi')
+    response = authed_client.get(
+        '/messages/conversations', headers={'If-None-Match': etag}
+    )
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_view_conversations_etag_changes_on_new_member(app, authed_client):
+    etag = authed_client.get('/messages/conversations').headers['ETag']
+    PrivateConversationState.add_many(1, [4])
+    response = authed_client.get(
+        '/messages/conversations', headers={'If-None-Match': etag}
+    )
+    assert response.status_code == 200
+
+
+def test_view_conversation_etag(app, authed_client):
+    response = authed_client.get(
+        '/messages/conversations/1', query_string={'page': 2}
+    )
+    etag = response.headers['ETag']
+    response = authed_client.get(
+        '/messages/conversations/1',
+        query_string={'page': 2},
+        headers={'If-None-Match': etag},
+    )
+    assert response.status_code == 304
+
+
+def test_view_conversation_etag_changes_on_modify(app, authed_client):
+    etag = authed_client.get('/messages/conversations/1').headers['ETag']
+    authed_client.put(
+        '/messages/conversations/1', data=json.dumps({'read': True})
+    )
+    response = authed_client.get(
+        '/messages/conversations/1', headers={'If-None-Match': etag}
+    )
+    assert response.status_code == 200
+    assert response.get_json()['response']['read'] is True
+
+
 def test_create_conversation(app, authed_client):
     response = authed_client.post(
         '/messages/conversations',
@@ -253,6 +395,8 @@ def test_delete_conversation_in_bulk(app, authed_client):
         is True
     )
     assert len(PrivateConversation.from_user(1)) == 0
+    response = authed_client.get('/messages/conversations').get_json()
+    assert response['response']['conversations_count'] == 0
 
 
 @pytest.mark.parametrize(
@@ -263,6 +407,7 @@ def test_delete_conversation_in_bulk(app, authed_client):
         ('/messages/conversations', 'POST'),
         ('/messages/conversations', 'PUT'),
         ('/messages/conversations/1', 'PUT'),
+        ('/messages/unread_count', 'GET'),
     ],
 )
 def test_route_permissions(app, authed_client, endpoint, method):
@@ -0,0 +1,156 @@
+import threading
+
+import pytest
+
+from core import db
+from messages import versions
+from messages.events import LocalBroker, RedisBroker
+from messages.models import PrivateMessage
+
+
+def test_local_broker_publish_and_wait():
+    broker = LocalBroker()
+    assert broker.wait(1, timeout=0) == []
+    broker.publish([1, 2], {'event': 'message'})
+    assert broker.wait(1, timeout=0) == [{'event': 'message'}]
+    assert broker.wait(1, timeout=0) == []
+    assert broker.wait(2, timeout=0) == []
+
+
+def test_local_broker_wakes_waiter():
+    broker = LocalBroker()
+    broker.wait(1, timeout=0)
+    received = []
+    waiter = threading.Thread(
+        target=lambda: received.extend(broker.wait(1, timeout=5))
+    )
+    waiter.start()
+    broker.publish([1], {'event': 'message'})
+    waiter.join()
+    assert received == [{'event': 'message'}]
+
+
+class FakeRedis:
+    """
+    The subset of the redis client used by RedisBroker, in memory. Calls to a
+    pipeline run immediately and their results are returned by execute.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.lists = {}
+        self.calls = []
+
+    def mget(self, *keys):
+        if not keys:
+            raise ValueError('MGET requires at least one key')
+        return [self.values.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def rpush(self, key, value):
+        self.lists.setdefault(key, []).append(value)
+
+    def ltrim(self, key, start, end):
+        stop = (end + 1) or None
+        self.lists[key] = self.lists.get(key, [])[start:stop]
+
+    def expire(self, key, ttl):
+        pass
+
+    def lrange(self, key, start, end):
+        return list(self.lists.get(key, []))
+
+    def delete(self, key):
+        self.lists.pop(key, None)
+
+    def blpop(self, key, timeout):
+        self.calls.append(('blpop', timeout))
+        if not self.lists.get(key):
+            return None
+        return key, self.lists[key].pop(0)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.results = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.results.append(getattr(self.client, name)(*args, **kwargs))
+            return self
+
+        return call
+
+    def execute(self):
+        results, self.results = self.results, []
+        return results
+
+
+def test_redis_broker_publish_and_wait():
+    broker = RedisBroker(FakeRedis(), backlog=2)
+    assert broker.wait(1, timeout=0) == []
+    broker.publish([1, 2], {'event': 'message', 'n': 1})
+    broker.publish([1], {'event': 'message', 'n': 2})
+    broker.publish([1], {'event': 'message', 'n': 3})
+    assert broker.wait(1, timeout=0) == [
+        {'event': 'message', 'n': 2},
+        {'event': 'message', 'n': 3},
+    ]
+    assert broker.wait(1, timeout=0) == []
+    assert broker.wait(2, timeout=0) == []
+
+
+def test_redis_broker_wait_without_timeout_does_not_block():
+    client = FakeRedis()
+    broker = RedisBroker(client)
+    assert broker.wait(1, timeout=0) == []
+    broker.publish([1], {'event': 'message'})
+    assert broker.wait(1, timeout=0) == [{'event': 'message'}]
+    assert broker.wait(1, timeout=0.5) == []
+    assert client.calls == [('blpop', 1)]
+
+
+def test_redis_broker_publish_to_nobody():
+    RedisBroker(FakeRedis()).publish([], {'event': 'message'})
+
+
+def test_view_events(app, authed_client):
+    response = authed_client.get(
+        '/messages/stream', query_string={'timeout': 0}
+    ).get_json()['response']
+    assert response == []
+    message = PrivateMessage.new(conv_id=1, user_id=2, contents='hi')
+    response = authed_client.get(
+        '/messages/stream', query_string={'timeout': 0}
+    ).get_json()['response']
+    assert response == [
+        {'event': 'message', 'conv_id': 1, 'message_id': message.id}
+    ]
+
+
+def test_new_message_skips_removed_members(app, client):
+    broker = app.extensions['messages_broker']
+    for user_id in [2, 3]:
+        assert broker.wait(user_id, timeout=0) == []
+    user_three_version = versions.of_user(3)
+    message = PrivateMessage.new(conv_id=3, user_id=1, contents='hi')
+    assert broker.wait(2, timeout=0) == [
+        {'event': 'message', 'conv_id': 3, 'message_id': message.id}
+    ]
+    assert broker.wait(3, timeout=0) == []
+    assert versions.of_user(3) == user_three_version
+
+
+@pytest.mark.parametrize('endpoint, method', [('/messages/stream', 'GET')])
+def test_route_permissions(app, authed_client, endpoint, method):
+    db.engine.execute('DELETE FROM users_permissions')
+    response = authed_client.open(endpoint, method=method).get_json()[
+        'response'
+    ]
+    assert response == 'You do not have permission to access this resource.'
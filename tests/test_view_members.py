@@ -81,3 +81,22 @@ def test_route_permissions(app, authed_client, endpoint, method):
         'response'
     ]
     assert response == 'You do not have permission to access this resource.'
+
+
+def test_readd_removed_member_to_conversation(app, authed_client):
+    add_permissions(app, MessagePermissions.MULTI_USER)
+    authed_client.delete(
+        '/messages/1/members', data=json.dumps({'user_ids': [3]})
+    )
+    response = authed_client.post(
+        '/messages/1/members', data=json.dumps({'user_ids': [3]})
+    ).get_json()['response']
+    assert {u['id'] for u in response} == {1, 2, 3}
+
+
+def test_add_invalid_members_to_conversation(app, authed_client):
+    add_permissions(app, MessagePermissions.MULTI_USER)
+    response = authed_client.post(
+        '/messages/1/members', data=json.dumps({'user_ids': [4, 999]})
+    ).get_json()['response']
+    assert response == 'The following user_ids are invalid: 999.'
@@ -0,0 +1,85 @@
+import pytest
+
+from core import db
+from messages.models import PrivateConversationState, PrivateMessage
+
+
+def test_search_messages(app, authed_client):
+    message = PrivateMessage.new(
+        conv_id=1, user_id=2, contents='The quick brown foxes jumped'
+    )
+    PrivateMessage.new(conv_id=4, user_id=2, contents='A brown fox')
+    response = authed_client.get(
+        '/messages/search', query_string={'q': 'fox'}
+    ).get_json()['response']
+    assert [m['id'] for m in response['messages']] == [message.id]
+    assert response['next_cursor'] is None
+
+
+def test_search_messages_ranked(app, authed_client):
+    weak = PrivateMessage.new(conv_id=1, user_id=2, contents='fox and hound')
+    strong = PrivateMessage.new(conv_id=2, user_id=2, contents='fox fox fox')
+    messages = PrivateMessage.search(1, 'fox')
+    assert [m.id for m in messages] == [strong.id, weak.id]
+
+
+def test_search_messages_skips_deleted_conversations(app, authed_client):
+    PrivateMessage.new(conv_id=1, user_id=2, contents='brown fox')
+    PrivateConversationState.from_attrs(conv_id=1, user_id=1).deleted = True
+    db.session.commit()
+    assert PrivateMessage.search(1, 'fox') == []
+
+
+def test_search_messages_cursor(app, authed_client):
+    ids = {
+        PrivateMessage.new(conv_id=1, user_id=2, contents=f'fox {i}').id
+        for i in range(30)
+    }
+    response = authed_client.get(
+        '/messages/search', query_string={'q': 'fox', 'limit': 25}
+    ).get_json()['response']
+    assert len(response['messages']) == 25
+    seen = {m['id'] for m in response['messages']}
+    response = authed_client.get(
+        '/messages/search',
+        query_string={
+            'q': 'fox',
+            'limit': 25,
+            'cursor': response['next_cursor'],
+        },
+    ).get_json()['response']
+    assert len(response['messages']) == 5
+    assert response['next_cursor'] is None
+    assert seen | {m['id'] for m in response['messages']} == ids
+
+
+def test_search_messages_cursor_mixed_ranks(app, authed_client):
+    ids = set()
+    for i in range(10):
+        ids.add(PrivateMessage.new(conv_id=1, user_id=2, contents='fox').id)
+        ids.add(
+            PrivateMessage.new(
+                conv_id=1, user_id=2, contents=f'fox and {i} hounds'
+            ).id
+        )
+    seen, cursor = [], None
+    for _ in range(10):
+        messages = PrivateMessage.search(1, 'fox', limit=3, cursor=cursor)
+        seen.extend(m.id for m in messages)
+        if len(messages) < 3:
+            break
+        cursor = messages[-1].search_cursor
+    assert sorted(seen) == sorted(ids)
+
+
+def test_search_messages_invalid_cursor(app, authed_client):
+    response = authed_client.get(
+        '/messages/search', query_string={'q': 'fox', 'cursor': 'abc'}
+    ).get_json()['response']
+    assert response == 'Invalid cursor.'
+
+
+@pytest.mark.parametrize('query_string', [{}, {'q': ''}])
+def test_search_messages_requires_terms(app, authed_client, query_string):
+    response = authed_client.get('/messages/search', query_string=query_string)
+    assert response.status_code == 400
@@ -0,0 +1,37 @@
+"""pm mailbox index
+
+Revision ID: 2f1c9a7d4e3b
+Revises: 7cda57a5e25b
+Create Date: 2026-10-17 10:12:41.332817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f1c9a7d4e3b'
+down_revision = '7cda57a5e25b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_pm_conversations_state_mailbox',
+        'pm_conversations_state',
+        [
+            'user_id',
+            'deleted',
+            sa.text('sticky DESC'),
+            sa.text('last_response_time DESC NULLS LAST'),
+            sa.text('conv_id DESC'),
+        ],
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'ix_pm_conversations_state_mailbox',
+        table_name='pm_conversations_state',
+    )
@@ -0,0 +1,33 @@
+"""pm messages search
+
+Revision ID: 4d8f2b6a9e17
+Revises: e1a7b3c9d052
+Create Date: 2026-10-17 15:02:41.308215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8f2b6a9e17'
+down_revision = 'e1a7b3c9d052'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Building the index on a large table takes a while, so do not lock out
+    # writes while it builds.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_pm_messages_contents_search',
+            'pm_messages',
+            [sa.text("to_tsvector('english'::regconfig, contents)")],
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    op.drop_index('ix_pm_messages_contents_search', table_name='pm_messages')
@@ -17,8 +17,86 @@ depends_on = None
 
 
 def upgrade():
-    pass
+    op.create_table(
+        'pm_conversations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('topic', sa.String(length=128), nullable=False),
+        sa.Column('sender_id', sa.Integer(), nullable=False),
+        sa.Column('locked', sa.Boolean(), server_default='f', nullable=False),
+        sa.ForeignKeyConstraint(['sender_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_table(
+        'pm_conversations_state',
+        sa.Column('conv_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('original_member', sa.Boolean(), nullable=False),
+        sa.Column('read', sa.Boolean(), server_default='f', nullable=False),
+        sa.Column('sticky', sa.Boolean(), server_default='f', nullable=False),
+        sa.Column('deleted', sa.Boolean(), server_default='f', nullable=False),
+        sa.Column(
+            'time_added',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+        sa.Column(
+            'last_response_time', sa.DateTime(timezone=True), nullable=True
+        ),
+        sa.ForeignKeyConstraint(['conv_id'], ['pm_conversations.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('conv_id', 'user_id'),
+    )
+    op.create_index(
+        op.f('ix_pm_conversations_state_deleted'),
+        'pm_conversations_state',
+        ['deleted'],
+        unique=False,
+    )
+    op.create_index(
+        op.f('ix_pm_conversations_state_sticky'),
+        'pm_conversations_state',
+        ['sticky'],
+        unique=False,
+    )
+    op.create_table(
+        'pm_messages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('conv_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column(
+            'time',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+        sa.Column('contents', sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(['conv_id'], ['pm_conversations.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        op.f('ix_pm_messages_conv_id'),
+        'pm_messages',
+        ['conv_id'],
+        unique=False,
+    )
+    op.create_index(
+        op.f('ix_pm_messages_time'), 'pm_messages', ['time'], unique=False
+    )
 
 
 def downgrade():
-    pass
+    op.drop_index(op.f('ix_pm_messages_time'), table_name='pm_messages')
+    op.drop_index(op.f('ix_pm_messages_conv_id'), table_name='pm_messages')
+    op.drop_table('pm_messages')
+    op.drop_index(
+        op.f('ix_pm_conversations_state_sticky'),
+        table_name='pm_conversations_state',
+    )
+    op.drop_index(
+        op.f('ix_pm_conversations_state_deleted'),
+        table_name='pm_conversations_state',
+    )
+    op.drop_table('pm_conversations_state')
+    op.drop_table('pm_conversations')
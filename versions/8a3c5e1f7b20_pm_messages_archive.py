@@ -0,0 +1,42 @@
+"""pm messages archive
+
+Revision ID: 8a3c5e1f7b20
+Revises: 4d8f2b6a9e17
+Create Date: 2026-10-17 16:11:07.552930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a3c5e1f7b20'
+down_revision = '4d8f2b6a9e17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'pm_messages_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('conv_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('contents', sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(['conv_id'], ['pm_conversations.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_pm_messages_archive_conv_id_id',
+        'pm_messages_archive',
+        ['conv_id', 'id'],
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'ix_pm_messages_archive_conv_id_id', table_name='pm_messages_archive'
+    )
+    op.drop_table('pm_messages_archive')
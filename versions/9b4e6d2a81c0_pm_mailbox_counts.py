@@ -0,0 +1,33 @@
+"""pm mailbox counts
+
+Revision ID: 9b4e6d2a81c0
+Revises: 2f1c9a7d4e3b
+Create Date: 2026-10-17 11:03:18.904215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e6d2a81c0'
+down_revision = '2f1c9a7d4e3b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'pm_mailbox_counts',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('inbox', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('sentbox', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('deleted', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('unread', sa.Integer(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('pm_mailbox_counts')
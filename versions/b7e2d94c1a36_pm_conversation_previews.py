@@ -0,0 +1,65 @@
+"""pm conversation previews
+
+Revision ID: b7e2d94c1a36
+Revises: 8a3c5e1f7b20
+Create Date: 2026-10-17 17:24:19.840117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d94c1a36'
+down_revision = '8a3c5e1f7b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'pm_conversations',
+        sa.Column('last_message_id', sa.Integer(), nullable=True),
+    )
+    op.add_column(
+        'pm_conversations',
+        sa.Column('last_sender_id', sa.Integer(), nullable=True),
+    )
+    op.add_column(
+        'pm_conversations',
+        sa.Column('last_snippet', sa.String(140), nullable=True),
+    )
+    op.create_foreign_key(
+        'pm_conversations_last_sender_id_fkey',
+        'pm_conversations',
+        'users',
+        ['last_sender_id'],
+        ['id'],
+    )
+    # Compressed contents are left without a snippet here; running
+    # `flask messages refresh-previews` fills them in.
+    op.execute(
+        r"""
+        UPDATE pm_conversations AS c
+        SET last_message_id = m.id, last_sender_id = m.user_id,
+            last_snippet = CASE WHEN m.contents LIKE E'\001%' THEN NULL
+                ELSE LEFT(BTRIM(REGEXP_REPLACE(m.contents, '\s+', ' ', 'g')), 140)
+            END
+        FROM (
+            SELECT DISTINCT ON (conv_id) id, conv_id, user_id, contents
+            FROM pm_messages ORDER BY conv_id, id DESC
+        ) AS m
+        WHERE m.conv_id = c.id
+        """
+    )
+
+
+def downgrade():
+    op.drop_constraint(
+        'pm_conversations_last_sender_id_fkey',
+        'pm_conversations',
+        type_='foreignkey',
+    )
+    op.drop_column('pm_conversations', 'last_snippet')
+    op.drop_column('pm_conversations', 'last_sender_id')
+    op.drop_column('pm_conversations', 'last_message_id')
@@ -0,0 +1,53 @@
+"""pm in_sentbox
+
+Revision ID: c5d83f0e7a14
+Revises: 9b4e6d2a81c0
+Create Date: 2026-10-17 11:48:52.117630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d83f0e7a14'
+down_revision = '9b4e6d2a81c0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'pm_conversations_state',
+        sa.Column(
+            'in_sentbox', sa.Boolean(), server_default='f', nullable=False
+        ),
+    )
+    op.execute(
+        """
+        UPDATE pm_conversations_state AS st SET in_sentbox = 't'
+        WHERE EXISTS (
+            SELECT 1 FROM pm_messages AS m
+            WHERE m.conv_id = st.conv_id AND m.user_id = st.user_id
+        )
+        """
+    )
+    op.create_index(
+        'ix_pm_conversations_state_sentbox',
+        'pm_conversations_state',
+        [
+            'user_id',
+            sa.text('sticky DESC'),
+            sa.text('last_response_time DESC NULLS LAST'),
+            sa.text('conv_id DESC'),
+        ],
+        postgresql_where=sa.text("in_sentbox = 't' AND deleted = 'f'"),
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'ix_pm_conversations_state_sentbox',
+        table_name='pm_conversations_state',
+    )
+    op.drop_column('pm_conversations_state', 'in_sentbox')
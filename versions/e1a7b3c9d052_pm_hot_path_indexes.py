@@ -0,0 +1,59 @@
+"""pm hot path indexes
+
+Revision ID: e1a7b3c9d052
+Revises: c5d83f0e7a14
+Create Date: 2026-10-17 13:26:05.671934
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1a7b3c9d052'
+down_revision = 'c5d83f0e7a14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_pm_conversations_state_inbox',
+        'pm_conversations_state',
+        [
+            'user_id',
+            sa.text('sticky DESC'),
+            sa.text('last_response_time DESC NULLS LAST'),
+            sa.text('conv_id DESC'),
+        ],
+        postgresql_where=sa.text(
+            "deleted = 'f' AND last_response_time IS NOT NULL"
+        ),
+    )
+    op.create_index(
+        'ix_pm_messages_conv_id_id', 'pm_messages', ['conv_id', 'id']
+    )
+    op.drop_index('ix_pm_messages_conv_id', table_name='pm_messages')
+    op.drop_index(
+        'ix_pm_conversations_state_sticky', table_name='pm_conversations_state'
+    )
+    op.drop_index(
+        'ix_pm_conversations_state_deleted',
+        table_name='pm_conversations_state',
+    )
+
+
+def downgrade():
+    op.create_index(
+        'ix_pm_conversations_state_deleted',
+        'pm_conversations_state',
+        ['deleted'],
+    )
+    op.create_index(
+        'ix_pm_conversations_state_sticky', 'pm_conversations_state', ['sticky']
+    )
+    op.create_index('ix_pm_messages_conv_id', 'pm_messages', ['conv_id'])
+    op.drop_index('ix_pm_messages_conv_id_id', table_name='pm_messages')
+    op.drop_index(
+        'ix_pm_conversations_state_inbox', table_name='pm_conversations_state'
+    )
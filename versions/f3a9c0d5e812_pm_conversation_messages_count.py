@@ -0,0 +1,39 @@
+"""pm conversation messages count
+
+Revision ID: f3a9c0d5e812
+Revises: b7e2d94c1a36
+Create Date: 2026-10-17 18:05:52.403761
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9c0d5e812'
+down_revision = 'b7e2d94c1a36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'pm_conversations',
+        sa.Column(
+            'messages_count', sa.Integer(), nullable=False, server_default='0'
+        ),
+    )
+    op.execute(
+        """
+        UPDATE pm_conversations AS c SET messages_count = (
+            SELECT COUNT(*) FROM pm_messages AS m WHERE m.conv_id = c.id
+        ) + (
+            SELECT COUNT(*) FROM pm_messages_archive AS a
+            WHERE a.conv_id = c.id
+        )
+        """
+    )
+
+
+def downgrade():
+    op.drop_column('pm_conversations', 'messages_count')